@@ -1,10 +1,19 @@
 from fastapi import APIRouter, HTTPException, BackgroundTasks
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
-from typing import List
-from app.models.damage_processor import DamageProcessor
+from typing import Dict, List
+from cachetools import TTLCache
+import asyncio
+from app.models.damage_processor import get_processor
+from app.utils.supabase_client import get_supabase
 
 router = APIRouter()
 
+# Status polling: clients poll every second for minutes, often several per
+# assessment. Rows are cached for 1s and concurrent misses share one query.
+_status_cache = TTLCache(maxsize=1024, ttl=1.0)
+_status_pending: Dict[str, asyncio.Future] = {}
+
 class ProcessAssessmentRequest(BaseModel):
     assessment_id: str
     photo_urls: List[str]
@@ -55,21 +64,22 @@ async def process_assessment(
         raise HTTPException(status_code=400, detail="At least one photo URL is required")
     
     # Set initial status to 'processing' in database BEFORE starting background task
-    from app.config import config
-    from supabase import create_client
-    if config.SUPABASE_URL and config.SUPABASE_SERVICE_KEY:
+    supabase = get_supabase()
+    if supabase:
         try:
-            supabase = create_client(config.SUPABASE_URL, config.SUPABASE_SERVICE_KEY)
-            supabase.table('assessments').update({
-                'status': 'processing',
-                'metadata': {'message': 'Processing started', 'progress': 0}
-            }).eq('id', assessment_id).execute()
+            # supabase-py is synchronous - keep it off the event loop
+            await run_in_threadpool(
+                supabase.table('assessments').update({
+                    'status': 'processing',
+                    'metadata': {'message': 'Processing started', 'progress': 0}
+                }).eq('id', assessment_id).execute
+            )
         except Exception as e:
             print(f"Warning: Could not set initial status: {e}")
     
-    # IMPORTANT: Create processor and add background task
+    # IMPORTANT: Use the shared processor and add background task
     # The background task runs ASYNCHRONOUSLY - this function returns immediately
-    processor = DamageProcessor()
+    processor = get_processor()
     
     # Create async wrapper for background processing
     async def run_processing():
@@ -86,6 +96,7 @@ async def process_assessment(
     # Add background task - FastAPI queues this and returns immediately
     # DO NOT await this - that would block the response
     background_tasks.add_task(run_processing)
+    _status_cache.pop(assessment_id, None)
     
     print(f"✅ Assessment {assessment_id} queued for processing. Returning immediately to client.")
     
@@ -96,27 +107,49 @@ async def process_assessment(
         message="Assessment processing started. Use /status endpoint to check progress."
     )
 
+async def _fetch_assessment_status(supabase, assessment_id: str):
+    """Read the status row, coalescing concurrent reads for the same assessment"""
+    if assessment_id in _status_cache:
+        return _status_cache[assessment_id]
+    
+    pending = _status_pending.get(assessment_id)
+    if pending is not None:
+        return await asyncio.shield(pending)
+    
+    future = asyncio.get_running_loop().create_future()
+    _status_pending[assessment_id] = future
+    try:
+        # Get assessment with estimated_cost and currency for completed assessments
+        response = await run_in_threadpool(
+            supabase.table('assessments').select(
+                'status, metadata, estimated_cost, currency'
+            ).eq('id', assessment_id).single().execute
+        )
+        _status_cache[assessment_id] = response.data
+        future.set_result(response.data)
+        return response.data
+    except Exception as e:
+        future.set_exception(e)
+        future.exception()  # mark retrieved when nobody else is waiting
+        raise
+    finally:
+        if not future.done():
+            future.cancel()
+        _status_pending.pop(assessment_id, None)
+
 @router.get("/assessments/{assessment_id}/status", response_model=AssessmentStatusResponse)
 async def get_assessment_status(assessment_id: str):
     """Get processing status of an assessment from Supabase"""
-    from app.config import config
-    from supabase import create_client, Client
-    
-    if not config.SUPABASE_URL or not config.SUPABASE_SERVICE_KEY:
+    supabase = get_supabase()
+    if not supabase:
         raise HTTPException(status_code=500, detail="Supabase not configured")
     
-    supabase: Client = create_client(config.SUPABASE_URL, config.SUPABASE_SERVICE_KEY)
-    
     try:
-        # Get assessment with estimated_cost and currency for completed assessments
-        response = supabase.table('assessments').select(
-            'status, metadata, estimated_cost, currency'
-        ).eq('id', assessment_id).single().execute()
+        assessment = await _fetch_assessment_status(supabase, assessment_id)
         
-        if not response.data:
+        if not assessment:
             raise HTTPException(status_code=404, detail="Assessment not found")
         
-        assessment = response.data
         status = assessment.get('status', 'pending')
         metadata = assessment.get('metadata', {}) or {}
         
@@ -2,14 +2,27 @@
 Flask API Server for YOLO Model Inference
 Runs YOLO model (handle_best.pt) behind a clean /predict API.
 Model loads lazily on first prediction to avoid Render startup timeout.
+
+Under `gunicorn --preload` with PRELOAD_MODEL=1 the weights are read once in the
+master and copy-on-write shared by the forked workers (CPU only: CUDA contexts
+don't survive fork, so GPU hosts should run 1 worker with more threads).
 """
-from flask import Flask, request, jsonify
+from flask import Flask, request
 from flask_cors import CORS
+from cachetools import TTLCache
 from ultralytics import YOLO
-from PIL import Image
-import io
-import base64
+import torch
+import cv2
+import numpy as np
+import orjson
+import binascii
+import fcntl
+import hashlib
 import os
+import queue
+import threading
+import time
+from collections import OrderedDict
 
 app = Flask(__name__)
 CORS(app)  # Allow calls from your Expo / React Native iOS app
@@ -17,26 +30,357 @@ CORS(app)  # Allow calls from your Expo / React Native iOS app
 # Global model variable — will be loaded only when needed
 model = None
 MODEL_PATH = os.getenv("MODEL_PATH", "handle_best.pt")
+_model_lock = threading.Lock()
+
+# Inference settings: FP16 on CUDA, fixed input size, and torch.compile
+# (CUDA only — Inductor needs a C++ toolchain on CPU, which the slim image lacks)
+USE_HALF = torch.cuda.is_available()
+DEVICE = torch.device("cuda" if USE_HALF else "cpu")
+IMG_SIZE = int(os.getenv("YOLO_IMGSZ", "640"))
+YOLO_COMPILE = USE_HALF and os.getenv("YOLO_COMPILE", "1") == "1"
+
+# Persist TorchInductor artifacts so restarts reuse compiled kernels
+os.environ.setdefault("TORCHINDUCTOR_CACHE_DIR", "/tmp/torch_cache")
+
+# Optional exported backend instead of eager PyTorch: "engine" (TensorRT FP16,
+# CUDA), "openvino" or "onnx" (CPU). Exported once; the artifact is reused
+# while the .pt's SHA-256 matches. YOLO_INT8_DATA (a calibration dataset YAML)
+# turns on INT8 for engine/openvino exports.
+YOLO_EXPORT = os.getenv("YOLO_EXPORT", "")
+YOLO_INT8_DATA = os.getenv("YOLO_INT8_DATA", "")
+_EXPORT_SUFFIXES = {"engine": ".engine", "onnx": ".onnx", "openvino": "_openvino_model"}
+
+# Micro-batching: concurrent /predict requests that arrive within MAX_WAIT_MS
+# of each other are coalesced into a single YOLO forward pass.
+MAX_BATCH = int(os.getenv("PREDICT_MAX_BATCH", "8"))
+MAX_WAIT_MS = float(os.getenv("PREDICT_MAX_WAIT_MS", "15"))
+
+_batch_queue = queue.Queue()
+_batch_worker = None
+_batch_worker_lock = threading.Lock()
+
+# Exact-bytes result cache: clients often retry or re-send the same frame.
+# Keyed by a BLAKE2b digest of the decoded image bytes.
+_result_cache = TTLCache(
+    maxsize=int(os.getenv("PREDICT_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("PREDICT_CACHE_TTL", "300")),
+)
+_result_cache_lock = threading.Lock()
+
+# Near-duplicate cache: re-uploads of the same panel rarely match byte-for-byte,
+# so frames whose perceptual hashes are within SEMANTIC_CACHE_RADIUS bits reuse
+# the earlier predictions. Off by default since it trades exactness for latency.
+SEMANTIC_CACHE_ENABLED = os.getenv("SEMANTIC_CACHE_ENABLED", "0") == "1"
+SEMANTIC_CACHE_RADIUS = int(os.getenv("SEMANTIC_CACHE_RADIUS", "6"))
+SEMANTIC_CACHE_SIZE = int(os.getenv("SEMANTIC_CACHE_SIZE", "256"))
+
+_semantic_cache = OrderedDict()  # perceptual hash (int) -> response payload, LRU order
+_semantic_cache_lock = threading.Lock()
 
 def load_model():
-    """Load the YOLO model only when first needed (lazy loading)."""
+    """Load the YOLO model only when first needed (lazy loading); the batching worker warms it up."""
     global model
-    if model is not None:
-        return  # already loaded
+    if model is None:
+        with _model_lock:
+            if model is None:  # not loaded by a concurrent request
+                model = _load_weights()
+
+
+def _export_model():
+    """Export MODEL_PATH to YOLO_EXPORT once and return the artifact path (MODEL_PATH on failure)."""
+    artifact = os.path.splitext(MODEL_PATH)[0] + _EXPORT_SUFFIXES[YOLO_EXPORT]
+    sha = hashlib.sha256()
+    with open(MODEL_PATH, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha.update(chunk)
+    digest = sha.hexdigest()
+
+    # Workers may race on first boot: one exports, the others wait and reuse it
+    with open(artifact + ".lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        try:
+            with open(artifact + ".sha256") as f:
+                if f.read().strip() == digest and os.path.exists(artifact):
+                    return artifact
+        except OSError:
+            pass
 
+        int8 = bool(YOLO_INT8_DATA) and YOLO_EXPORT in ("engine", "openvino")
+        try:
+            print(f"[YOLO] Exporting {MODEL_PATH} to {YOLO_EXPORT}{' (INT8)' if int8 else ''} ...")
+            artifact = YOLO(MODEL_PATH).export(
+                format=YOLO_EXPORT,
+                imgsz=IMG_SIZE,
+                half=USE_HALF and not int8,  # FP16 export needs a GPU
+                int8=int8,
+                data=YOLO_INT8_DATA or None,
+                dynamic=True,  # the batching worker sends up to MAX_BATCH frames
+                batch=MAX_BATCH,
+            )
+        except Exception as e:
+            print(f"[YOLO] Export to {YOLO_EXPORT} failed, using PyTorch: {e}")
+            return MODEL_PATH
+        with open(artifact + ".sha256", "w") as f:
+            f.write(digest)
+        return artifact
+
+
+def _load_weights():
+    """Read and fuse the weights. Safe to run in the gunicorn master: no inference happens here."""
     try:
         print(f"[YOLO] Loading model from {MODEL_PATH} ... (may take 30-120s first time)")
-        model = YOLO(MODEL_PATH)
-        print(f"[YOLO] Model loaded successfully from {MODEL_PATH}")
+        path = _export_model() if YOLO_EXPORT in _EXPORT_SUFFIXES else MODEL_PATH
+        loaded = YOLO(path, task="detect")
+        if path == MODEL_PATH:
+            loaded.fuse()  # exported graphs are already fused
+        print(f"[YOLO] Model loaded successfully from {path}")
+        return loaded
     except Exception as e:
         print(f"[YOLO] ERROR loading model from {MODEL_PATH}: {e}")
-        model = None
+        return None
 
 
-@app.route("/", methods=["GET"])
-def root():
-    """Basic info endpoint."""
-    return jsonify(
+def _optimize_model(yolo):
+    """
+    Compile on CUDA and warm up so the first request isn't penalized.
+    Runs on the batching thread: CUDA graphs recorded here are per thread.
+    """
+    # Same input form the batching worker sends: a normalized BCHW tensor
+    dummy = torch.zeros((1, 3, IMG_SIZE, IMG_SIZE), device=DEVICE)
+    dummy = dummy.half() if USE_HALF else dummy
+    # First call builds the predictor (FP16 weights on CUDA)
+    yolo(dummy, verbose=False, half=USE_HALF, imgsz=IMG_SIZE)
+
+    if not YOLO_COMPILE or not isinstance(yolo.model, torch.nn.Module):  # exported backends
+        return
+    # Compile the predictor's network, not yolo.model: the predictor re-fuses
+    # yolo.model on setup, which would unwrap a compiled module.
+    eager = yolo.predictor.model.model
+    try:
+        yolo.predictor.model.model = torch.compile(eager, mode="reduce-overhead", fullgraph=False)
+        # Trigger compilation and record a CUDA graph for every batch size the
+        # batching worker can send, so none of that happens on a live request
+        for batch_size in range(1, MAX_BATCH + 1):
+            yolo(dummy.repeat(batch_size, 1, 1, 1), verbose=False, half=USE_HALF, imgsz=IMG_SIZE)
+        print("[YOLO] torch.compile enabled")
+    except Exception as e:
+        yolo.predictor.model.model = eager
+        print(f"[YOLO] torch.compile unavailable, using eager mode: {e}")
+
+
+def perceptual_hash(img, hash_size=16):
+    """256-bit difference hash (dHash) of a BGR image, as an int."""
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY)
+    small = cv2.resize(gray, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = (small[:, 1:] > small[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), "big")
+
+
+def _semantic_cache_get(phash):
+    """Return cached payload for a hash within SEMANTIC_CACHE_RADIUS bits, if any."""
+    with _semantic_cache_lock:
+        match = None
+        for key in _semantic_cache:
+            if (key ^ phash).bit_count() <= SEMANTIC_CACHE_RADIUS:
+                match = key
+                break
+        if match is None:
+            return None
+        _semantic_cache.move_to_end(match)
+        return _semantic_cache[match]
+
+
+def _semantic_cache_put(phash, payload):
+    with _semantic_cache_lock:
+        _semantic_cache[phash] = payload
+        _semantic_cache.move_to_end(phash)
+        while len(_semantic_cache) > SEMANTIC_CACHE_SIZE:
+            _semantic_cache.popitem(last=False)
+
+
+def _columnar_payload(xyxy, conf, cls, img):
+    """Predictions as one array per field (the form kept in the caches)."""
+    # Rows of the transposed copy are contiguous, which orjson needs for ndarrays
+    x1, y1, x2, y2 = np.ascontiguousarray(xyxy.T)
+    names = model.names
+    return {
+        "predictions": {
+            "class": [names[c] for c in cls.tolist()],
+            "confidence": conf,
+            "x": x1,
+            "y": y1,
+            "width": x2 - x1,
+            "height": y2 - y1,
+        },
+        "image": {"width": img.shape[1], "height": img.shape[0]},
+    }
+
+
+def _row_payload(payload):
+    """Expand a columnar payload into the default one-dict-per-detection response."""
+    p = payload["predictions"]
+    # .tolist() converts each column to Python floats in one C pass
+    return {
+        "predictions": [
+            {"class": c, "confidence": cf, "x": x, "y": y, "width": w, "height": h}
+            for c, cf, x, y, w, h in zip(
+                p["class"],
+                p["confidence"].tolist(),
+                p["x"].tolist(),
+                p["y"].tolist(),
+                p["width"].tolist(),
+                p["height"].tolist(),
+            )
+        ],
+        "image": payload["image"],
+    }
+
+
+def _rescale_payload(payload, width, height):
+    """Adapt cached predictions to the current image's dimensions."""
+    sx = width / payload["image"]["width"]
+    sy = height / payload["image"]["height"]
+    if sx == 1 and sy == 1:
+        return payload
+    p = payload["predictions"]
+    return {
+        "predictions": {
+            "class": p["class"],
+            "confidence": p["confidence"],
+            "x": p["x"] * sx,
+            "y": p["y"] * sy,
+            "width": p["width"] * sx,
+            "height": p["height"] * sy,
+        },
+        "image": {"width": width, "height": height},
+    }
+
+
+class _PendingPrediction:
+    """One /predict image waiting for the batching worker."""
+
+    __slots__ = ("image", "event", "result", "error")
+
+    def __init__(self, image):
+        self.image = image
+        self.event = threading.Event()
+        self.result = None
+        self.error = None
+
+
+def _letterbox_into(dst, img):
+    """Resize a BGR image into the square RGB slot dst, keeping aspect ratio; return (gain, pad_x, pad_y)."""
+    h, w = img.shape[:2]
+    gain = min(IMG_SIZE / h, IMG_SIZE / w)
+    nw, nh = round(w * gain), round(h * gain)
+    pad_x, pad_y = (IMG_SIZE - nw) // 2, (IMG_SIZE - nh) // 2
+    if (nw, nh) != (w, h):
+        img = cv2.resize(img, (nw, nh), interpolation=cv2.INTER_LINEAR)
+    dst[...] = 114  # Ultralytics' letterbox grey
+    dst[pad_y:pad_y + nh, pad_x:pad_x + nw] = img[..., ::-1]
+    return gain, pad_x, pad_y
+
+
+def _unletterbox(data, letterbox, img):
+    """Map one image's host-side box rows (xyxy, ..., conf, cls) from the IMG_SIZE square back to the original image."""
+    gain, pad_x, pad_y = letterbox
+    h, w = img.shape[:2]
+    xyxy = (data[:, :4] - np.array([pad_x, pad_y, pad_x, pad_y], dtype=data.dtype)) / gain
+    np.clip(xyxy, 0, [w, h, w, h], out=xyxy)
+    # conf is copied out of the strided row view: orjson only serializes C-contiguous arrays
+    return xyxy, np.ascontiguousarray(data[:, -2]), data[:, -1].astype(np.int32)
+
+
+def _batch_worker_loop():
+    """Drain the queue into batches of up to MAX_BATCH and run them through YOLO."""
+    # One letterbox buffer for the worker's lifetime (pinned on CUDA for async H2D copies)
+    shape = (MAX_BATCH, IMG_SIZE, IMG_SIZE, 3)
+    if USE_HALF:
+        batch_buf = torch.empty(shape, dtype=torch.uint8).pin_memory().numpy()
+    else:
+        batch_buf = np.empty(shape, dtype=np.uint8)
+
+    # Warm up here, not in a request thread: the graphs must be recorded on the
+    # thread that replays them. Workers start after fork, so this is per process.
+    try:
+        _optimize_model(model)
+    except Exception as e:
+        print(f"[YOLO] Warm-up failed, continuing unwarmed: {e}")
+
+    while True:
+        batch = [_batch_queue.get()]
+        deadline = time.monotonic() + MAX_WAIT_MS / 1000.0
+        while len(batch) < MAX_BATCH:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(_batch_queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+
+        try:
+            n = len(batch)
+            letterboxes = [_letterbox_into(batch_buf[i], item.image) for i, item in enumerate(batch)]
+            # NHWC uint8 -> normalized NCHW on the device in one transfer
+            with torch.inference_mode():
+                inputs = torch.from_numpy(batch_buf[:n]).to(DEVICE, non_blocking=True).permute(0, 3, 1, 2)
+                inputs = (inputs.half() if USE_HALF else inputs.float()).div_(255)
+                results = model(inputs, verbose=False, half=USE_HALF, imgsz=IMG_SIZE)
+                # One device->host copy for the whole batch instead of three per image
+                datas = [result.boxes.data for result in results]
+                host = torch.cat(datas).float().cpu().numpy()
+            splits = np.cumsum([len(d) for d in datas[:-1]])
+            for item, data, letterbox in zip(batch, np.split(host, splits), letterboxes):
+                item.result = _unletterbox(data, letterbox, item.image)
+        except Exception as e:
+            for item in batch:
+                item.error = e
+        finally:
+            for item in batch:
+                item.event.set()
+
+
+def _ensure_batch_worker():
+    """Start the batching thread in this process (gunicorn forks workers after import)."""
+    global _batch_worker
+    if _batch_worker is not None and _batch_worker.is_alive():
+        return
+    with _batch_worker_lock:
+        if _batch_worker is None or not _batch_worker.is_alive():
+            _batch_worker = threading.Thread(
+                target=_batch_worker_loop, name="yolo-batcher", daemon=True
+            )
+            _batch_worker.start()
+
+
+def run_batched_inference(img):
+    """Queue an image for the batching worker; block until its (xyxy, conf, cls) arrays are ready."""
+    _ensure_batch_worker()
+    pending = _PendingPrediction(img)
+    _batch_queue.put(pending)
+    pending.event.wait()
+    if pending.error is not None:
+        raise pending.error
+    return pending.result
+
+
+def _json_bytes(obj):
+    return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY)
+
+
+def ojson(obj, status=200):
+    """JSON response encoded with orjson (handles NumPy scalars and arrays natively)."""
+    return app.response_class(
+        _json_bytes(obj),
+        status=status,
+        mimetype="application/json",
+    )
+
+
+# Static response bodies, encoded once at import (keyed by model_loaded)
+_ROOT_JSON = {
+    loaded: _json_bytes(
         {
             "status": "ok",
             "message": "YOLO inference server (model loads on first /predict)",
@@ -44,22 +388,49 @@ def root():
                 "GET /health": "health check",
                 "POST /predict": "run YOLO on base64 image",
             },
-            "model_loaded": model is not None,
+            "model_loaded": loaded,
+            "model_path": MODEL_PATH,
+        }
+    )
+    for loaded in (False, True)
+}
+_HEALTH_JSON = {
+    loaded: _json_bytes(
+        {
+            "status": "healthy" if loaded else "model_not_loaded_yet",
+            "model_loaded": loaded,
             "model_path": MODEL_PATH,
         }
     )
+    for loaded in (False, True)
+}
+_PREDICT_USAGE_JSON = _json_bytes(
+    {
+        "status": "ok",
+        "usage": "Send POST with base64 image to get YOLO predictions.",
+        "body_options": {
+            "binary": "raw image bytes (Content-Type: application/octet-stream or image/*)",
+            "json": {"image": "<base64-string>"},
+            "raw": "raw base64 body (e.g. from mobile app)",
+        },
+    }
+)
+
+
+def _static_json(body):
+    return app.response_class(body, mimetype="application/json")
+
+
+@app.route("/", methods=["GET"])
+def root():
+    """Basic info endpoint."""
+    return _static_json(_ROOT_JSON[model is not None])
 
 
 @app.route("/health", methods=["GET"])
 def health():
     """Health check — fast response, no model loading here."""
-    return jsonify(
-        {
-            "status": "healthy" if model is not None else "model_not_loaded_yet",
-            "model_loaded": model is not None,
-            "model_path": MODEL_PATH,
-        }
-    )
+    return _static_json(_HEALTH_JSON[model is not None])
 
 
 @app.route("/predict", methods=["POST", "GET"])
@@ -71,113 +442,146 @@ def predict():
     Supported POST body formats:
       1) Raw base64 string (Content-Type: application/x-www-form-urlencoded or text/plain)
       2) JSON: { "image": "<base64-string>" } (Content-Type: application/json)
+      3) Raw image bytes (Content-Type: application/octet-stream or image/*)
+    ?format=columnar returns one array per field instead of one object per detection.
     """
     if request.method == "GET":
-        return jsonify(
-            {
-                "status": "ok",
-                "usage": "Send POST with base64 image to get YOLO predictions.",
-                "body_options": {
-                    "json": {"image": "<base64-string>"},
-                    "raw": "raw base64 body (e.g. from mobile app)",
-                },
-            }
-        )
+        return _static_json(_PREDICT_USAGE_JSON)
 
     # Load model lazily on first real prediction request
     load_model()
 
     if model is None:
-        return (
-            jsonify(
-                {
-                    "error": "model_not_loaded",
-                    "message": f"Failed to load YOLO model from {MODEL_PATH}. Check server logs.",
-                }
-            ),
+        return ojson(
+            {
+                "error": "model_not_loaded",
+                "message": f"Failed to load YOLO model from {MODEL_PATH}. Check server logs.",
+            },
             500,
         )
 
-    # Extract base64 image from request
-    content_type = (request.headers.get("Content-Type") or "").lower()
+    # Extract image from request
+    # Werkzeug parses, lowercases and caches the mimetype (parameters stripped)
+    content_type = request.mimetype
     image_base64 = None
+    img_bytes = None
 
-    if "application/json" in content_type:
-        data = request.get_json(silent=True) or {}
-        image_base64 = data.get("image")
+    if content_type == "application/octet-stream" or content_type.startswith("image/"):
+        # Binary upload: no base64 pass and 33% less payload
+        img_bytes = request.get_data(cache=False)
+    elif content_type == "application/json":
+        # orjson parses straight from the body bytes; reject malformed payloads up front
+        try:
+            data = orjson.loads(request.get_data(cache=False))
+        except orjson.JSONDecodeError as e:
+            return ojson({"error": "invalid_json", "message": str(e)}, 400)
+        image_base64 = data.get("image") if isinstance(data, dict) else None
+        if image_base64 is not None and not isinstance(image_base64, str):
+            return ojson(
+                {"error": "invalid_json", "message": "\"image\" must be a base64 string"},
+                400,
+            )
     else:
         # Assume raw base64 body (common for mobile apps)
-        image_base64 = request.get_data(as_text=True).strip()
-
-    if not image_base64:
-        return (
-            jsonify(
-                {
-                    "error": "no_image",
-                    "message": "No image data provided. Send base64 in JSON or raw body.",
-                }
-            ),
+        image_base64 = request.get_data().strip()
+
+    if not image_base64 and not img_bytes:
+        return ojson(
+            {
+                "error": "no_image",
+                "message": "No image data provided. Send binary, base64 in JSON, or raw base64 body.",
+            },
             400,
         )
 
+    # ?nocache=1 bypasses the result cache so QA can still exercise the model
+    use_cache = request.args.get("nocache") != "1"
+    render = (lambda p: p) if request.args.get("format") == "columnar" else _row_payload
+
     try:
-        # Decode base64 → PIL Image
-        img_bytes = base64.b64decode(image_base64)
-        img = Image.open(io.BytesIO(img_bytes)).convert("RGB")
+        if img_bytes is None:
+            img_bytes = binascii.a2b_base64(image_base64)
+        cache_key = hashlib.blake2b(img_bytes, digest_size=16).digest()
+        if use_cache:
+            with _result_cache_lock:
+                cached = _result_cache.get(cache_key)
+            if cached is not None:
+                return ojson(render(cached))
+
+        # Decode bytes → contiguous uint8 HWC array (BGR, which Ultralytics expects for ndarrays)
+        img = cv2.imdecode(np.frombuffer(img_bytes, dtype=np.uint8), cv2.IMREAD_COLOR)
+        if img is None:
+            raise ValueError("unsupported or corrupt image data")
     except Exception as e:
-        return (
-            jsonify(
-                {
-                    "error": "invalid_image",
-                    "message": f"Could not decode base64 image: {str(e)}",
-                }
-            ),
+        return ojson(
+            {
+                "error": "invalid_image",
+                "message": f"Could not decode image: {str(e)}",
+            },
             400,
         )
 
+    phash = None
+    if SEMANTIC_CACHE_ENABLED and use_cache:
+        phash = perceptual_hash(img)
+        cached = _semantic_cache_get(phash)
+        if cached is not None:
+            return ojson(render(_rescale_payload(cached, img.shape[1], img.shape[0])))
+
     try:
-        # Run YOLO inference
-        results = model(img, verbose=False)
-        result = results[0]
-        predictions = []
-
-        if result.boxes is not None:
-            for box in result.boxes:
-                predictions.append(
-                    {
-                        "class": result.names[int(box.cls[0])],
-                        "confidence": float(box.conf[0]),
-                        "x": float(box.xyxy[0][0]),
-                        "y": float(box.xyxy[0][1]),
-                        "width": float(box.xyxy[0][2] - box.xyxy[0][0]),
-                        "height": float(box.xyxy[0][3] - box.xyxy[0][1]),
-                    }
-                )
-
-        return jsonify(
-            {
-                "predictions": predictions,
-                "image": {"width": img.width, "height": img.height},
-            }
-        )
+        # Run YOLO inference (batched with any concurrent requests)
+        xyxy, conf, cls = run_batched_inference(img)
+        payload = _columnar_payload(xyxy, conf, cls, img)
+        with _result_cache_lock:
+            _result_cache[cache_key] = payload
+        if phash is not None:
+            _semantic_cache_put(phash, payload)
+        return ojson(render(payload))
 
     except Exception as e:
-        return (
-            jsonify(
-                {
-                    "error": "inference_error",
-                    "message": f"Failed to run YOLO inference: {str(e)}",
-                }
-            ),
+        return ojson(
+            {
+                "error": "inference_error",
+                "message": f"Failed to run YOLO inference: {str(e)}",
+            },
             500,
         )
 
 
+class _UnknownPathShortCircuit:
+    """
+    WSGI middleware: answer paths outside the API with a static 404 before
+    Flask routing, so scanner probes never reach the view/JSON machinery.
+    """
+
+    BODY = b'{"detail":"Not Found"}'
+    HEADERS = [("Content-Type", "application/json"), ("Content-Length", str(len(BODY)))]
+
+    def __init__(self, inner, paths):
+        self.inner = inner
+        self.paths = frozenset(paths)
+
+    def __call__(self, environ, start_response):
+        if environ.get("PATH_INFO", "") in self.paths:
+            return self.inner(environ, start_response)
+        start_response("404 Not Found", list(self.HEADERS))
+        return [self.BODY]
+
+
+app.wsgi_app = _UnknownPathShortCircuit(app.wsgi_app, {"/", "/health", "/predict"})
+
+
 @app.errorhandler(404)
 def not_found(_):
     """Clean 404 response."""
-    return jsonify({"detail": "Not Found"}), 404
+    return ojson({"detail": "Not Found"}, 404)
 
 
 # IMPORTANT: Do NOT add app.run() here — Render uses gunicorn
 # No if __name__ == "__main__" block needed
+
+# With `gunicorn --preload`, read the weights in the master so forked workers
+# share one resident copy. Skipped on CUDA, where each worker needs its own context.
+# Exports run forward passes, so they stay out of the master too.
+if os.getenv("PRELOAD_MODEL", "0") == "1" and not USE_HALF and not YOLO_EXPORT:
+    model = _load_weights()
@@ -1,8 +1,33 @@
 import os
+import sys
+from types import MappingProxyType
 from dotenv import load_dotenv
 
 load_dotenv()
 
+MODELS_BASE_PATH = os.getenv("MODELS_BASE_PATH", "./models")
+
+# Processing (module-level so hot loops can import them directly)
+MAX_PHOTOS_PER_ASSESSMENT = 10
+CONFIDENCE_THRESHOLD = 0.3
+IOU_THRESHOLD = 0.5
+
+# Model paths (will be downloaded from Supabase Storage).
+# Built once at import, interned, and read-only.
+MODEL_NAMES = (
+    'handle',
+    'component',
+    'side_hunter',
+    'side_kulas',
+    'damage_sindhu',
+    'damage_cddce',
+    'damage_capstone',
+)
+MODEL_PATHS = MappingProxyType({
+    sys.intern(name): sys.intern(f"{MODELS_BASE_PATH}/{name}/best.pt")
+    for name in MODEL_NAMES
+})
+
 class Config:
     # Supabase
     SUPABASE_URL = os.getenv("SUPABASE_URL")
@@ -10,26 +35,30 @@ class Config:
     
     # Model storage
     MODELS_BUCKET = "yolo-models"
-    MODELS_BASE_PATH = os.getenv("MODELS_BASE_PATH", "./models")
+    MODELS_BASE_PATH = MODELS_BASE_PATH
     
     # Storage paths
     PHOTOS_BASE_PATH = os.getenv("PHOTOS_BASE_PATH", "./temp_photos")
     PDFS_BASE_PATH = os.getenv("PDFS_BASE_PATH", "./temp_pdfs")
     
+    # Inference backend: 'pt' (default) runs eager PyTorch. 'onnx', 'engine'
+    # (TensorRT, CUDA only) or 'openvino' export each .pt once and cache the
+    # artifact next to it; 'auto' picks TensorRT on GPU hosts and OpenVINO on
+    # CPU hosts. Exports are opt-in because their runtimes (onnxruntime,
+    # openvino, tensorrt) aren't in requirements.txt and Ultralytics would
+    # pip-install them on first boot. Install the runtime before setting ENGINE.
+    ENGINE_BACKEND = os.getenv("ENGINE", "pt")
+    ENGINE_IMGSZ = 640
+    # Calibration dataset YAML (~200 held-out photos) for INT8 exports of the
+    # damage models; unset keeps them at FP16 (GPU) / FP32 (CPU). Delete the
+    # cached artifacts after changing it so they are re-exported.
+    ENGINE_INT8_DATA = os.getenv("ENGINE_INT8_DATA")
+
     # Processing
-    MAX_PHOTOS_PER_ASSESSMENT = 10
-    CONFIDENCE_THRESHOLD = 0.3
-    IOU_THRESHOLD = 0.5
+    MAX_PHOTOS_PER_ASSESSMENT = MAX_PHOTOS_PER_ASSESSMENT
+    CONFIDENCE_THRESHOLD = CONFIDENCE_THRESHOLD
+    IOU_THRESHOLD = IOU_THRESHOLD
     
-    # Model paths (will be downloaded from Supabase Storage)
-    MODEL_PATHS = {
-        'handle': f"{MODELS_BASE_PATH}/handle/best.pt",
-        'component': f"{MODELS_BASE_PATH}/component/best.pt",
-        'side_hunter': f"{MODELS_BASE_PATH}/side_hunter/best.pt",
-        'side_kulas': f"{MODELS_BASE_PATH}/side_kulas/best.pt",
-        'damage_sindhu': f"{MODELS_BASE_PATH}/damage_sindhu/best.pt",
-        'damage_cddce': f"{MODELS_BASE_PATH}/damage_cddce/best.pt",
-        'damage_capstone': f"{MODELS_BASE_PATH}/damage_capstone/best.pt",
-    }
+    MODEL_PATHS = MODEL_PATHS
 
 config = Config()
@@ -1,6 +1,8 @@
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 from app.api.routes import router
+from app.models.damage_processor import get_processor
+from app.utils.model_loader import aclose as close_model_downloads
 from app.yolo import router as yolo_router  
 
 app = FastAPI(
@@ -32,6 +34,13 @@ async def root():
 app.include_router(yolo_router)
 
 
+@app.on_event("shutdown")
+async def shutdown():
+    """Close the shared HTTP connection pools"""
+    await get_processor().aclose()
+    await close_model_downloads()
+
+
 @app.get("/health")
 async def health():
     return {"status": "healthy"}
@@ -4,41 +4,135 @@ Ported from Python V3.8 code
 """
 
 import os
+import gc
+import logging
 import asyncio
+import threading
+import importlib.util
+from functools import lru_cache
+from concurrent.futures import ThreadPoolExecutor
 import httpx
 import aiofiles
 import cv2
 import numpy as np
-from PIL import Image as PILImage
-from ultralytics.utils.plotting import Annotator
 from typing import Dict, List, Tuple
-from app.config import config
+from app.config import config, IOU_THRESHOLD, MODEL_NAMES
 from app.utils.scale_calculator import calculate_scale
 from app.utils.consensus import get_multi_model_consensus
-from app.utils.cost_calculator import calculate_costs
+from app.utils.box_math import paint_area as box_paint_area
+from app.utils.cost_calculator import calculate_costs, CostBreakdown
 from app.utils.model_loader import load_models
 from app.utils.pdf_generator import generate_invoice_pdf, generate_analysis_pdf
-from supabase import create_client, Client
+from app.utils.supabase_client import get_supabase
+from supabase import Client
 from datetime import datetime
 
+log = logging.getLogger(__name__)
+
+# Ultralytics predictors release the GIL inside torch, so the 7 models can run
+# side by side. One lock per model: a predictor must not serve two threads at
+# once (e.g. two assessments processing concurrently).
+_inference_pool = ThreadPoolExecutor(max_workers=len(MODEL_NAMES), thread_name_prefix="yolo")
+_model_locks = {name: threading.Lock() for name in MODEL_NAMES}
+
+# HTTP/2 lets concurrent photo downloads multiplex over one connection
+# (httpx needs the optional 'h2' package for it)
+_HTTP2 = importlib.util.find_spec('h2') is not None
+
+# Minimum seconds between progress writes for one assessment
+STATUS_WRITE_INTERVAL = 0.5
+
+# Consensus images only go into the PDF report: quality 85 encodes faster and
+# smaller than OpenCV's default 95 at no visible cost there. (OpenCV wheels
+# already encode with SIMD libjpeg-turbo.)
+_CONSENSUS_JPEG_PARAMS = [cv2.IMWRITE_JPEG_QUALITY, 85]
+
+# Result metadata keys written by _save_results, in order
+_RESULT_METADATA_KEYS = (
+    # Final status message, written together with the results
+    'message',
+    'progress',
+    # Match Python script report_data keys
+    'consensus_damage_cm2',
+    'Paint Costs Local',
+    'Lights Repair Cost (Local)',
+    'Windshield Repair Cost (Local)',
+    'Tire Repair Cost (Local)',
+    'Subtotal Cost (Local)',
+    'Tax Amount (Local)',
+    'Subtotal Post Base Tax (Local)',
+    'Luxury Factor',
+    'Final Cost (Local)',
+    'Sindhu Damage (cm²)',
+    'CDDCE Damage (cm²)',
+    'Capstone Damage (cm²)',
+    'Tax Rate',
+    'Light Damage Found',
+    'Windshield Damage Found',
+    # Also keep shorter keys for API compatibility
+    'paint_costs',
+    'light_repair_cost',
+    'windshield_repair_cost',
+    'tire_repair_cost',
+    'sindhu_damage_cm2',
+    'cddce_damage_cm2',
+    'capstone_damage_cm2',
+)
+
+# Confidence threshold per model (matches the Python V3.8 script)
+_MODEL_CONF = {
+    'handle': 0.4,
+    'component': 0.4,
+    'side_hunter': 0.5,
+    'side_kulas': 0.4,
+    'damage_sindhu': 0.3,
+    'damage_cddce': 0.3,
+    'damage_capstone': 0.3,
+}
+
 class DamageProcessor:
     def __init__(self):
-        self.supabase: Client = None
-        if config.SUPABASE_URL and config.SUPABASE_SERVICE_KEY:
-            self.supabase = create_client(
-                config.SUPABASE_URL,
-                config.SUPABASE_SERVICE_KEY
-            )
+        self.supabase: Client = get_supabase()
         self.models = {}
         self.models_loaded = False
+        self._models_lock = asyncio.Lock()
+        # Long-lived connection pool for photo downloads, reused across assessments
+        self._http = httpx.AsyncClient(
+            timeout=60.0,
+            http2=_HTTP2,
+            limits=httpx.Limits(max_connections=32, max_keepalive_connections=16)
+        )
+        # Last metadata written per assessment, so status updates merge
+        # locally instead of selecting the row before every update
+        self._metadata_cache: Dict[str, Dict] = {}
+        # Progress updates are debounced: only the latest pending one per
+        # assessment is written, at most every STATUS_WRITE_INTERVAL seconds
+        self._pending_status: Dict[str, Tuple] = {}
+        self._status_writers: Dict[str, asyncio.Task] = {}
     
     async def load_models_if_needed(self):
         """Load YOLO models (only once)"""
-        if not self.models_loaded:
-            print("Loading YOLO models...")
-            self.models = await load_models()
-            self.models_loaded = True
-            print(f"Loaded {len(self.models)} models")
+        async with self._models_lock:
+            if not self.models_loaded:
+                print("Loading YOLO models...")
+                self.models = await load_models()
+                self.models_loaded = True
+                print(f"Loaded {len(self.models)} models")
+                # Move the (large, long-lived) model object graphs out of the
+                # collector's reach so GC passes during processing stay cheap
+                gc.collect()
+                gc.freeze()
+    
+    async def aclose(self):
+        """Close the HTTP connection pool (called on app shutdown)"""
+        await self._http.aclose()
+    
+    async def _run_model(self, name: str, sources: List[np.ndarray]) -> List:
+        """Run one model over all photos as a single batch in the inference pool"""
+        def predict():
+            with _model_locks[name]:
+                return self.models[name](sources, conf=_MODEL_CONF[name], verbose=False, batch=len(sources))
+        return await asyncio.get_running_loop().run_in_executor(_inference_pool, predict)
     
     async def process_assessment(self, assessment_data: Dict):
         """
@@ -53,11 +147,11 @@ class DamageProcessor:
             print(f"{'='*90}\n")
             
             # Update status to processing
-            await self._update_status(assessment_id, 'processing', 'Initializing...', 5)
+            self._queue_status(assessment_id, 'processing', 'Initializing...', 5)
             
             # STEP 1: Load all models FIRST (matches Python script line 817-825)
             print("Loading YOLO models...")
-            await self._update_status(assessment_id, 'processing', 'Loading AI models...', 10)
+            self._queue_status(assessment_id, 'processing', 'Loading AI models...', 10)
             await self.load_models_if_needed()
             
             if not self.models or len(self.models) < 7:
@@ -92,20 +186,40 @@ class DamageProcessor:
             os.makedirs(temp_dir, exist_ok=True)
             
             # Update progress: photos downloaded
-            await self._update_status(assessment_id, 'processing', f'Processing {len(photo_paths)} photos...')
-            
+            self._queue_status(assessment_id, 'processing', f'Processing {len(photo_paths)} photos...')
+            
+            # Decode each photo once (BGR, EXIF-rotated like Ultralytics' own
+            # loader); all 7 models share these arrays instead of re-reading files
+            images = await asyncio.gather(*(asyncio.to_thread(cv2.imread, p) for p in photo_paths))
+            unreadable = [p for p, im in zip(photo_paths, images) if im is None]
+            if unreadable:
+                raise Exception(f"Could not decode photos: {unreadable}")
+            
+            # Run every model once over all photos (one batched forward pass per
+            # model, the 7 models side by side). The loop below only reads results.
+            print(f"Running 7 models on {len(photo_paths)} photos...")
+            results_by_model = dict(zip(MODEL_NAMES, await asyncio.gather(
+                *(self._run_model(name, images) for name in MODEL_NAMES)
+            )))
+            
+            annotate_tasks: Dict[int, asyncio.Task] = {}
             for photo_num, photo_path in enumerate(photo_paths, 1):
                 print(f"\n{'='*50} PROCESSING PHOTO {photo_num}/{len(photo_paths)}: {photo_path} {'='*50}")
                 
-                # Get image dimensions
-                img = PILImage.open(photo_path)
-                w_px, h_px = img.size
+                i = photo_num - 1
+                handle_res = results_by_model['handle'][i]
+                
+                # Get image dimensions (already known from the decode YOLO did)
+                h_px, w_px = handle_res.orig_shape
                 print(f"Image size: {w_px} × {h_px} px\n")
                 
-                # STEP 1: Run handle and component models FIRST for scale calculation
+                component_res = results_by_model['component'][i]
+                sindhu_res = results_by_model['damage_sindhu'][i]
+                cddce_res = results_by_model['damage_cddce'][i]
+                capstone_res = results_by_model['damage_capstone'][i]
+                
+                # STEP 1: Handle and component results drive the scale calculation
                 print(f"Step 1: Calculating scale...")
-                handle_res = self.models['handle'](photo_path, conf=0.4, verbose=False)[0]
-                component_res = self.models['component'](photo_path, conf=0.4, verbose=False)[0]
                 
                 # STEP 2: Calculate scale (MUST BE DONE BEFORE DAMAGE MODELS)
                 scale_data = calculate_scale(
@@ -123,17 +237,6 @@ class DamageProcessor:
                 print(f"Scale: {scale_data['source']} → {scale_cm_per_px:.6f} cm/px")
                 print(f"Estimated image width: {w_px * scale_cm_per_px:.1f} cm\n")
                 
-                # STEP 3: Run orientation models (for reporting/logging)
-                print(f"Step 2: Detecting orientation...")
-                hunter_res = self.models['side_hunter'](photo_path, conf=0.5, verbose=False)[0]
-                kulas_res = self.models['side_kulas'](photo_path, conf=0.4, verbose=False)[0]
-                
-                # STEP 4: Run damage models (using scale already calculated)
-                print(f"Step 3: Running damage detection models...")
-                sindhu_res = self.models['damage_sindhu'](photo_path, conf=0.3, verbose=False)[0]
-                cddce_res = self.models['damage_cddce'](photo_path, conf=0.3, verbose=False)[0]
-                capstone_res = self.models['damage_capstone'](photo_path, conf=0.3, verbose=False)[0]
-                
                 # STEP 5: Calculate damage areas from individual models (for reporting)
                 t1 = self._calculate_damage_area(sindhu_res, scale_cm_per_px)
                 t2 = self._calculate_damage_area(cddce_res, scale_cm_per_px)
@@ -147,7 +250,7 @@ class DamageProcessor:
                 print(f"Step 4: Calculating consensus damage...")
                 consensus = get_multi_model_consensus(
                     [sindhu_res, cddce_res, capstone_res],
-                    iou_threshold=config.IOU_THRESHOLD
+                    iou_threshold=IOU_THRESHOLD
                 )
                 print(f"Found {len(consensus)} consensus damage items")
                 
@@ -155,16 +258,18 @@ class DamageProcessor:
                 t_cons = self._calculate_consensus_area(consensus, scale_cm_per_px)
                 total_consensus_area += t_cons
                 
-                # STEP 8: Generate annotated consensus image
-                consensus_path = None
+                # STEP 8: Generate annotated consensus image in a worker thread;
+                # drawing + JPEG encoding overlaps the rest of the photo loop
                 if consensus:
                     print(f"Step 5: Generating annotated image...")
-                    consensus_path = await self._generate_consensus_image(
-                        photo_path,
+                    # Draw on the already-decoded frame instead of re-reading the file
+                    annotate_tasks[photo_num] = asyncio.create_task(asyncio.to_thread(
+                        self._generate_consensus_image,
+                        capstone_res.orig_img,
                         consensus,
                         temp_dir,
                         photo_num
-                    )
+                    ))
                 
                 # STEP 9: Calculate paint area and component flags for this photo
                 print(f"Step 6: Calculating costs for photo {photo_num}...")
@@ -183,7 +288,7 @@ class DamageProcessor:
                 
                 # Update progress: photo processed
                 progress = int((photo_num / len(photo_paths)) * 80)  # 0-80% for photo processing
-                await self._update_status(assessment_id, 'processing', f'Processed photo {photo_num}/{len(photo_paths)}...', progress)
+                self._queue_status(assessment_id, 'processing', f'Processed photo {photo_num}/{len(photo_paths)}...', progress)
                 
                 # Store photo results
                 photo_results.append({
@@ -191,14 +296,20 @@ class DamageProcessor:
                     'photo_path': photo_path,
                     'scale_data': scale_data,
                     'consensus': consensus,
-                    'consensus_path': consensus_path,
+                    'consensus_path': None,  # filled in once its annotate task finishes
                     'paint_area': paint_area,
                     'tire_boxes': tire_boxes,
                 })
             
+            # Wait for the annotated images (only the PDFs need them)
+            for result in photo_results:
+                task = annotate_tasks.get(result['photo_num'])
+                if task is not None:
+                    result['consensus_path'] = await task
+            
             # STEP 12: Calculate final costs (following Python script procedure)
             print(f"\n{'='*50} CALCULATING FINAL COSTS {'='*50}")
-            await self._update_status(assessment_id, 'processing', 'Calculating final costs...', 85)
+            self._queue_status(assessment_id, 'processing', 'Calculating final costs...', 85)
             
             cost_data = calculate_costs(
                 photo_results,
@@ -214,20 +325,20 @@ class DamageProcessor:
             )
             
             print(f"Cost breakdown:")
-            print(f"  Paint total: {cost_data['paint_total_jod']:.2f} JOD")
-            print(f"  Light cost: {cost_data['light_cost_jod']:.2f} JOD")
-            print(f"  Windshield cost: {cost_data['windshield_cost_jod']:.2f} JOD")
-            print(f"  Tire cost: {cost_data['tire_cost_jod']:.2f} JOD")
-            print(f"  Subtotal (base): {cost_data['subtotal_local_base']:.2f} {cost_data['currency']}")
-            print(f"  Tax ({cost_data['tax_rate']*100:.2f}%): {cost_data['tax_amount_on_base_local']:.2f} {cost_data['currency']}")
-            print(f"  Subtotal (post-tax): {cost_data['subtotal_post_base_tax']:.2f} {cost_data['currency']}")
-            print(f"  Luxury factor (car): {cost_data['luxury_index']:.2f}")
-            print(f"  Country lux factor: {cost_data['country_lux_factor']:.3f}")
-            print(f"  FINAL COST: {cost_data['final_local_cost']:.2f} {cost_data['currency']}")
+            print(f"  Paint total: {cost_data.paint_total_jod:.2f} JOD")
+            print(f"  Light cost: {cost_data.light_cost_jod:.2f} JOD")
+            print(f"  Windshield cost: {cost_data.windshield_cost_jod:.2f} JOD")
+            print(f"  Tire cost: {cost_data.tire_cost_jod:.2f} JOD")
+            print(f"  Subtotal (base): {cost_data.subtotal_local_base:.2f} {cost_data.currency}")
+            print(f"  Tax ({cost_data.tax_rate*100:.2f}%): {cost_data.tax_amount_on_base_local:.2f} {cost_data.currency}")
+            print(f"  Subtotal (post-tax): {cost_data.subtotal_post_base_tax:.2f} {cost_data.currency}")
+            print(f"  Luxury factor (car): {cost_data.luxury_index:.2f}")
+            print(f"  Country lux factor: {cost_data.country_lux_factor:.3f}")
+            print(f"  FINAL COST: {cost_data.final_local_cost:.2f} {cost_data.currency}")
             
             # STEP 13: Generate PDFs
             print(f"\n{'='*50} GENERATING PDF REPORTS {'='*50}")
-            await self._update_status(assessment_id, 'processing', 'Generating PDF reports...', 88)
+            self._queue_status(assessment_id, 'processing', 'Generating PDF reports...', 88)
             
             pdf_urls = await self._generate_and_upload_pdfs(
                 assessment_id,
@@ -238,8 +349,9 @@ class DamageProcessor:
             
             # STEP 14: Save results to Supabase
             print(f"\n{'='*50} SAVING RESULTS {'='*50}")
-            await self._update_status(assessment_id, 'processing', 'Saving results...', 92)
+            self._queue_status(assessment_id, 'processing', 'Saving results...', 92)
             
+            await self._flush_status(assessment_id)
             await self._save_results(
                 assessment_id,
                 cost_data,
@@ -252,50 +364,40 @@ class DamageProcessor:
                 pdf_urls
             )
             
-            # STEP 14: Update status to completed (status already set in _save_results)
+            # STEP 14: Status is set to completed by _save_results (same write as the results)
             print(f"\n{'='*50} ASSESSMENT COMPLETE {'='*50}")
             print(f"✅ Assessment {assessment_id} processed successfully!")
             print(f"   Total Consensus Damage: {total_consensus_area:.1f} cm²")
-            print(f"   Final Cost: {cost_data['final_local_cost']:.2f} {cost_data['currency']}")
+            print(f"   Final Cost: {cost_data.final_local_cost:.2f} {cost_data.currency}")
             print(f"{'='*90}\n")
             
-            # Ensure status is set to completed (in case _save_results didn't update it)
-            await self._update_status(assessment_id, 'completed', 'Assessment processing completed!', 100)
-            
         except Exception as e:
             print(f"\n❌ ERROR processing assessment {assessment_id}: {e}")
             import traceback
             traceback.print_exc()
             error_message = str(e)
+            await self._flush_status(assessment_id)
             await self._update_status(assessment_id, 'failed', error_message, 0)
             # Don't re-raise - let it fail gracefully and mark as failed in database
             print(f"Assessment {assessment_id} marked as failed in database")
+        finally:
+            self._metadata_cache.pop(assessment_id, None)
+            self._pending_status.pop(assessment_id, None)
     
     def _calculate_damage_area(self, results, scale_cm_per_px: float) -> float:
         """Calculate total damage area in cm² from a single model"""
-        total = 0.0
-        if results.boxes is not None:
-            for box in results.boxes:
-                w_px = box.xywh[0][2].item()
-                h_px = box.xywh[0][3].item()
-                w_cm = w_px * scale_cm_per_px
-                h_cm = h_px * scale_cm_per_px
-                area = w_cm * h_cm
-                total += area
-        return total
+        if results.boxes is None or len(results.boxes) == 0:
+            return 0.0
+        # One (N, 2) device->host copy instead of two .item() calls per box
+        wh = results.boxes.xywh[:, 2:4].cpu().numpy().astype(np.float64)
+        return float((wh[:, 0] * wh[:, 1]).sum()) * scale_cm_per_px ** 2
     
     def _calculate_consensus_area(self, consensus: List[Dict], scale_cm_per_px: float) -> float:
         """Calculate total consensus damage area in cm²"""
-        total = 0.0
-        for item in consensus:
-            xyxy = item['xyxy']
-            w_px = xyxy[2] - xyxy[0]
-            h_px = xyxy[3] - xyxy[1]
-            w_cm = w_px * scale_cm_per_px
-            h_cm = h_px * scale_cm_per_px
-            area = w_cm * h_cm
-            total += area
-        return total
+        if not consensus:
+            return 0.0
+        a = np.asarray([item['xyxy'] for item in consensus], dtype=np.float64)
+        return float(((a[:, 2] - a[:, 0]) * (a[:, 3] - a[:, 1])).sum()) * scale_cm_per_px ** 2
     
     def _calculate_paint_area(
         self,
@@ -322,6 +424,7 @@ class DamageProcessor:
         has_tire = False
         
         # Process each consensus item (matches Python script lines 985-1011)
+        candidates = []
         for item in consensus:
             # Get detected class name (lowercase for matching)
             detected_class_lower = item.get('detected_class', '').lower() if item.get('detected_class') else ''
@@ -336,87 +439,119 @@ class DamageProcessor:
                 has_light = True
                 continue  # Don't add to paint area (matches Python line 991)
             
-            # STEP 3: Other damages - check tire overlap (matches Python lines 992-1011)
-            xyxy = item['xyxy']
-            damage_area_px = (xyxy[2] - xyxy[0]) * (xyxy[3] - xyxy[1])
-            area_cm2 = damage_area_px * (scale_cm_per_px ** 2)
-            
-            # Check if damage overlaps with tire (>50% overlap = tire damage)
-            overlapped_tire = False
-            for tire_box in tire_boxes:
-                xi1 = max(xyxy[0], tire_box[0])
-                yi1 = max(xyxy[1], tire_box[1])
-                xi2 = min(xyxy[2], tire_box[2])
-                yi2 = min(xyxy[3], tire_box[3])
-                inter = max(0, xi2 - xi1) * max(0, yi2 - yi1)
-                
-                # If >50% overlap with tire, it's tire damage (matches Python line 1005)
-                if inter / (damage_area_px + 1e-6) > 0.5:
-                    overlapped_tire = True
-                    has_tire = True
-                    break
-            
-            # Only add to paint area if NOT overlapped with tire (matches Python line 1010)
-            if not overlapped_tire:
-                paint_area += area_cm2
+            candidates.append(item['xyxy'])
+        
+        if not candidates:
+            return (paint_area, has_windshield, has_light, has_tire)
+        
+        # STEP 3: Other damages - check tire overlap (matches Python lines 992-1011).
+        # >50% of the damage box inside any tire box = tire damage, excluded from paint area
+        paint_area, has_tire = box_paint_area(
+            np.asarray(candidates, dtype=np.float64),
+            np.asarray(tire_boxes, dtype=np.float64).reshape(-1, 4),
+            scale_cm_per_px
+        )
         
         return (paint_area, has_windshield, has_light, has_tire)
     
-    async def _generate_consensus_image(
+    def _generate_consensus_image(
         self,
-        photo_path: str,
+        img: np.ndarray,
         consensus: List[Dict],
         temp_dir: str,
         photo_num: int
     ) -> str:
-        """Generate annotated consensus image"""
-        img = cv2.imread(photo_path)
+        """Generate annotated consensus image from the decoded BGR photo"""
         if img is None:
             return None
+        img = img.copy()  # the decoded photo is shared by every model's results
         
-        annotator = Annotator(img, line_width=4)
+        # Plain cv2 drawing: same boxes, colors and label style as
+        # Annotator.box_label, without its per-photo setup
+        lw, tf, fs = 4, 3, 4 / 3
+        w = img.shape[1]
         for item in consensus:
-            xyxy = item['xyxy']
-            box = xyxy.astype(int).tolist() if isinstance(xyxy, np.ndarray) else [int(x) for x in xyxy]
+            x1, y1, x2, y2 = (int(v) for v in item['xyxy'])
             
             if item.get('is_windshield', False):
-                label = f"Windshield {item['conf']:.2f}"
-                annotator.box_label(box, label, color=(0, 255, 0))  # Green
+                label, color = f"Windshield {item['conf']:.2f}", (0, 255, 0)  # Green
             elif item.get('is_light', False):
-                label = f"Light {item['conf']:.2f}"
-                annotator.box_label(box, label, color=(255, 255, 0))  # Yellow
+                label, color = f"Light {item['conf']:.2f}", (255, 255, 0)  # Yellow
             else:
-                label = f"Damage {item['conf']:.2f}"
-                annotator.box_label(box, label, color=(0, 0, 255))  # Red
+                label, color = f"Damage {item['conf']:.2f}", (0, 0, 255)  # Red
+            
+            cv2.rectangle(img, (x1, y1), (x2, y2), color, lw, cv2.LINE_AA)
+            (tw, th), _ = cv2.getTextSize(label, cv2.FONT_HERSHEY_SIMPLEX, fs, tf)
+            th += 3  # text padding
+            # Label origin clamped like Annotator.box_label: above the box when it
+            # fits, otherwise inside it; shifted left so it never runs off the right edge
+            lx = max(0, min(x1, w - tw))
+            ly = max(0, y1)
+            outside = ly >= th
+            cv2.rectangle(img, (lx, ly), (lx + tw, ly - th if outside else ly + th), color, -1, cv2.LINE_AA)
+            cv2.putText(
+                img, label, (lx, ly - 2 if outside else ly + th - 1),
+                cv2.FONT_HERSHEY_SIMPLEX, fs, (255, 255, 255), tf, cv2.LINE_AA
+            )
         
-        annotated = annotator.result()
+        annotated = img
         consensus_path = os.path.join(temp_dir, f"photo{photo_num}_consensus.jpg")
-        cv2.imwrite(consensus_path, annotated)
+        cv2.imwrite(consensus_path, annotated, _CONSENSUS_JPEG_PARAMS)
         
         return consensus_path
     
     async def _download_photos(self, photo_urls: List[str], assessment_id: str) -> List[str]:
-        """Download photos from Supabase Storage URLs"""
+        """Download photos from Supabase Storage URLs (concurrently, order preserved)"""
         os.makedirs(f"{config.PHOTOS_BASE_PATH}/{assessment_id}", exist_ok=True)
-        photo_paths = []
         
-        async with httpx.AsyncClient(timeout=60.0) as client:
-            for i, url in enumerate(photo_urls):
-                try:
-                    response = await client.get(url)
-                    response.raise_for_status()
-                    photo_path = f"{config.PHOTOS_BASE_PATH}/{assessment_id}/photo_{i+1}.jpg"
-                    
-                    async with aiofiles.open(photo_path, 'wb') as f:
-                        await f.write(response.content)
-                    
-                    photo_paths.append(photo_path)
-                except Exception as e:
-                    print(f"Error downloading photo {i+1}: {e}")
-                    continue
+        async def download(i: int, url: str) -> str:
+            photo_path = f"{config.PHOTOS_BASE_PATH}/{assessment_id}/photo_{i+1}.jpg"
+            # Stream to disk in 64 KB chunks instead of buffering the whole photo
+            async with self._http.stream('GET', url) as response:
+                response.raise_for_status()
+                content_type = response.headers.get('content-type', '')
+                if content_type and not content_type.startswith(('image/', 'application/octet-stream')):
+                    raise ValueError(f"unexpected content-type {content_type!r}")
+                
+                async with aiofiles.open(photo_path, 'wb') as f:
+                    async for chunk in response.aiter_bytes(64 * 1024):
+                        await f.write(chunk)
+            
+            return photo_path
+        
+        results = await asyncio.gather(
+            *(download(i, url) for i, url in enumerate(photo_urls)),
+            return_exceptions=True
+        )
+        
+        photo_paths = []
+        for i, result in enumerate(results):
+            if isinstance(result, Exception):
+                print(f"Error downloading photo {i+1}: {result}")
+                continue
+            photo_paths.append(result)
         
         return photo_paths
     
+    def _queue_status(self, assessment_id: str, status: str, message: str = None, progress: int = None):
+        """Record a progress update without waiting on Supabase; a background writer flushes it"""
+        self._pending_status[assessment_id] = (status, message, progress)
+        writer = self._status_writers.get(assessment_id)
+        if writer is None or writer.done():
+            self._status_writers[assessment_id] = asyncio.create_task(self._status_writer(assessment_id))
+    
+    async def _status_writer(self, assessment_id: str):
+        """Write the latest queued update, then wait before writing the next one"""
+        while assessment_id in self._pending_status:
+            await self._update_status(assessment_id, *self._pending_status.pop(assessment_id))
+            await asyncio.sleep(STATUS_WRITE_INTERVAL)
+    
+    async def _flush_status(self, assessment_id: str):
+        """Wait for queued progress updates so a final status can't be overwritten by them"""
+        writer = self._status_writers.pop(assessment_id, None)
+        if writer is not None:
+            await writer
+    
     async def _update_status(self, assessment_id: str, status: str, message: str = None, progress: int = None):
         """Update assessment status in Supabase"""
         if not self.supabase:
@@ -433,21 +568,29 @@ class DamageProcessor:
             metadata['progress'] = progress
         
         if metadata:
-            # Merge with existing metadata
-            try:
-                existing = self.supabase.table('assessments').select('metadata').eq('id', assessment_id).single().execute()
-                if existing.data and existing.data.get('metadata'):
-                    # Merge metadata, but keep existing keys if they exist
-                    existing_metadata = existing.data['metadata'] or {}
-                    metadata = {**existing_metadata, **metadata}
-            except Exception as e:
-                # If we can't fetch existing metadata, just use new metadata
-                print(f"Note: Could not fetch existing metadata: {e}")
+            # Merge with existing metadata (fetched once per assessment, then cached)
+            existing_metadata = self._metadata_cache.get(assessment_id)
+            if existing_metadata is None:
+                existing_metadata = {}
+                try:
+                    existing = await asyncio.to_thread(
+                        self.supabase.table('assessments').select('metadata').eq('id', assessment_id).single().execute
+                    )
+                    if existing.data and existing.data.get('metadata'):
+                        existing_metadata = existing.data['metadata'] or {}
+                except Exception as e:
+                    # If we can't fetch existing metadata, just use new metadata
+                    print(f"Note: Could not fetch existing metadata: {e}")
             
+            metadata = {**existing_metadata, **metadata}
+            self._metadata_cache[assessment_id] = metadata
             update_data['metadata'] = metadata
         
         try:
-            response = self.supabase.table('assessments').update(update_data).eq('id', assessment_id).execute()
+            # supabase-py is synchronous - keep it off the event loop
+            await asyncio.to_thread(
+                self.supabase.table('assessments').update(update_data).eq('id', assessment_id).execute
+            )
             if message:
                 print(f"📊 Status update: {status} - {message} (progress: {progress}%)")
             elif status in ['completed', 'failed']:
@@ -461,7 +604,7 @@ class DamageProcessor:
         self,
         assessment_id: str,
         photo_results: List[Dict],
-        cost_data: Dict,
+        cost_data: CostBreakdown,
         assessment_data: Dict
     ) -> Dict[str, str]:
         """Generate and upload PDF reports to Supabase Storage"""
@@ -478,9 +621,11 @@ class DamageProcessor:
             country = 'Unknown'
             
             try:
-                assessment = self.supabase.table('assessments').select(
-                    'user_id, metadata, car_make, car_model, car_year'
-                ).eq('id', assessment_id).single().execute()
+                assessment = await asyncio.to_thread(
+                    self.supabase.table('assessments').select(
+                        'user_id, metadata, car_make, car_model, car_year'
+                    ).eq('id', assessment_id).single().execute
+                )
                 
                 if assessment.data:
                     user_id = assessment.data.get('user_id')
@@ -511,7 +656,7 @@ class DamageProcessor:
                 'date': datetime.now().strftime("%Y-%m-%d"),
                 'customer_name': customer_name,
                 'country': country,
-                'currency': cost_data.get('currency', 'JOD'),
+                'currency': cost_data.currency,
             }
             
             # Prepare analysis text
@@ -523,11 +668,11 @@ class DamageProcessor:
             analysis_lines.append(f"Currency: {report_data['currency']}")
             analysis_lines.append("")
             analysis_lines.append("Cost Summary:")
-            analysis_lines.append(f"  Paint Total: {cost_data.get('paint_total_jod', 0):.2f} JOD")
-            analysis_lines.append(f"  Light Cost: {cost_data.get('light_cost_jod', 0):.2f} JOD")
-            analysis_lines.append(f"  Windshield Cost: {cost_data.get('windshield_cost_jod', 0):.2f} JOD")
-            analysis_lines.append(f"  Tire Cost: {cost_data.get('tire_cost_jod', 0):.2f} JOD")
-            analysis_lines.append(f"  Final Cost: {cost_data.get('final_local_cost', 0):.2f} {report_data['currency']}")
+            analysis_lines.append(f"  Paint Total: {cost_data.paint_total_jod:.2f} JOD")
+            analysis_lines.append(f"  Light Cost: {cost_data.light_cost_jod:.2f} JOD")
+            analysis_lines.append(f"  Windshield Cost: {cost_data.windshield_cost_jod:.2f} JOD")
+            analysis_lines.append(f"  Tire Cost: {cost_data.tire_cost_jod:.2f} JOD")
+            analysis_lines.append(f"  Final Cost: {cost_data.final_local_cost:.2f} {report_data['currency']}")
             analysis_text = '\n'.join(analysis_lines)
             
             # Generate PDFs locally
@@ -537,80 +682,38 @@ class DamageProcessor:
             invoice_pdf_path = os.path.join(pdf_dir, f"{assessment_id}-invoice.pdf")
             analysis_pdf_path = os.path.join(pdf_dir, f"{assessment_id}-analysis.pdf")
             
-            # Generate invoice PDF
-            print(f"Generating invoice PDF...")
-            generate_invoice_pdf(
-                assessment_id,
-                invoice_pdf_path,
-                photo_results,
-                cost_data,
-                report_data
-            )
-            
-            # Generate analysis PDF
-            print(f"Generating analysis PDF...")
-            generate_analysis_pdf(
-                assessment_id,
-                analysis_pdf_path,
-                analysis_text,
-                photo_results
+            # Generate both PDFs concurrently off the event loop
+            print(f"Generating invoice and analysis PDFs...")
+            # Both PDFs embed the same photos; decode and downscale each once
+            image_cache: Dict = {}
+            await asyncio.gather(
+                asyncio.to_thread(
+                    generate_invoice_pdf,
+                    assessment_id,
+                    invoice_pdf_path,
+                    photo_results,
+                    cost_data,
+                    report_data,
+                    image_cache=image_cache
+                ),
+                asyncio.to_thread(
+                    generate_analysis_pdf,
+                    assessment_id,
+                    analysis_pdf_path,
+                    analysis_text,
+                    photo_results,
+                    image_cache=image_cache
+                )
             )
             
-            # Upload to Supabase Storage
+            # Upload both to Supabase Storage concurrently
             pdfs_bucket = "assessment-pdfs"
             storage_path_prefix = f"{user_id}/{assessment_id}"
             
-            # Upload invoice PDF
-            if os.path.exists(invoice_pdf_path):
-                with open(invoice_pdf_path, 'rb') as f:
-                    invoice_data = f.read()
-                    invoice_storage_path = f"{storage_path_prefix}/invoice.pdf"
-                    try:
-                        # Supabase Python client syntax
-                        result = self.supabase.storage.from_(pdfs_bucket).upload(
-                            invoice_storage_path,
-                            invoice_data,
-                            file_options={"content-type": "application/pdf", "upsert": "true"}
-                        )
-                        # Get public URL
-                        public_url_result = self.supabase.storage.from_(pdfs_bucket).get_public_url(invoice_storage_path)
-                        pdf_urls['invoice_url'] = public_url_result
-                        print(f"✅ Invoice PDF uploaded: {public_url_result}")
-                    except Exception as e:
-                        print(f"⚠️  Error uploading invoice PDF: {e}")
-                        # Try alternative method if first fails
-                        try:
-                            # Alternative: direct URL construction
-                            pdf_urls['invoice_url'] = f"{config.SUPABASE_URL}/storage/v1/object/public/{pdfs_bucket}/{invoice_storage_path}"
-                            print(f"✅ Invoice PDF URL constructed: {pdf_urls['invoice_url']}")
-                        except:
-                            pass
-            
-            # Upload analysis PDF
-            if os.path.exists(analysis_pdf_path):
-                with open(analysis_pdf_path, 'rb') as f:
-                    analysis_data = f.read()
-                    analysis_storage_path = f"{storage_path_prefix}/analysis.pdf"
-                    try:
-                        # Supabase Python client syntax
-                        result = self.supabase.storage.from_(pdfs_bucket).upload(
-                            analysis_storage_path,
-                            analysis_data,
-                            file_options={"content-type": "application/pdf", "upsert": "true"}
-                        )
-                        # Get public URL
-                        public_url_result = self.supabase.storage.from_(pdfs_bucket).get_public_url(analysis_storage_path)
-                        pdf_urls['analysis_url'] = public_url_result
-                        print(f"✅ Analysis PDF uploaded: {public_url_result}")
-                    except Exception as e:
-                        print(f"⚠️  Error uploading analysis PDF: {e}")
-                        # Try alternative method if first fails
-                        try:
-                            # Alternative: direct URL construction
-                            pdf_urls['analysis_url'] = f"{config.SUPABASE_URL}/storage/v1/object/public/{pdfs_bucket}/{analysis_storage_path}"
-                            print(f"✅ Analysis PDF URL constructed: {pdf_urls['analysis_url']}")
-                        except:
-                            pass
+            pdf_urls['invoice_url'], pdf_urls['analysis_url'] = await asyncio.gather(
+                self._upload_pdf(pdfs_bucket, invoice_pdf_path, f"{storage_path_prefix}/invoice.pdf", "Invoice"),
+                self._upload_pdf(pdfs_bucket, analysis_pdf_path, f"{storage_path_prefix}/analysis.pdf", "Analysis")
+            )
             
         except Exception as e:
             print(f"❌ Error generating/uploading PDFs: {e}")
@@ -620,10 +723,36 @@ class DamageProcessor:
         
         return pdf_urls
     
+    async def _upload_pdf(self, bucket: str, pdf_path: str, storage_path: str, label: str) -> str:
+        """Upload one PDF to Supabase Storage and return its public URL, or None"""
+        if not os.path.exists(pdf_path):
+            return None
+        
+        async with aiofiles.open(pdf_path, 'rb') as f:
+            pdf_data = await f.read()
+        try:
+            # Supabase Python client syntax (blocking - run it in a worker thread)
+            await asyncio.to_thread(
+                self.supabase.storage.from_(bucket).upload,
+                storage_path,
+                pdf_data,
+                file_options={"content-type": "application/pdf", "upsert": "true"}
+            )
+            # Get public URL
+            public_url = self.supabase.storage.from_(bucket).get_public_url(storage_path)
+            print(f"✅ {label} PDF uploaded: {public_url}")
+            return public_url
+        except Exception as e:
+            print(f"⚠️  Error uploading {label.lower()} PDF: {e}")
+            # Alternative: direct URL construction
+            public_url = f"{config.SUPABASE_URL}/storage/v1/object/public/{bucket}/{storage_path}"
+            print(f"✅ {label} PDF URL constructed: {public_url}")
+            return public_url
+    
     async def _save_results(
         self,
         assessment_id: str,
-        cost_data: Dict,
+        cost_data: CostBreakdown,
         total_consensus_area: float,
         t1_total: float,
         t2_total: float,
@@ -640,14 +769,14 @@ class DamageProcessor:
         # Prepare update data matching Python script structure (lines 1100-1124)
         update_data = {
             'status': 'completed',  # Mark as completed
-            'estimated_cost': cost_data['final_local_cost'],
-            'subtotal_base': cost_data['subtotal_local_base'],
-            'tax_rate': cost_data['tax_rate'],
-            'tax_amount': cost_data['tax_amount_on_base_local'],
-            'subtotal_post_tax': cost_data['subtotal_post_base_tax'],
-            'luxury_factor': cost_data['luxury_index'],
-            'country_lux_factor': cost_data['country_lux_factor'],
-            'currency': cost_data['currency'],
+            'estimated_cost': cost_data.final_local_cost,
+            'subtotal_base': cost_data.subtotal_local_base,
+            'tax_rate': cost_data.tax_rate,
+            'tax_amount': cost_data.tax_amount_on_base_local,
+            'subtotal_post_tax': cost_data.subtotal_post_base_tax,
+            'luxury_factor': cost_data.luxury_index,
+            'country_lux_factor': cost_data.country_lux_factor,
+            'currency': cost_data.currency,
         }
         
         # Add PDF URLs if available
@@ -659,44 +788,70 @@ class DamageProcessor:
                 update_data['metadata']['analysis_pdf_url'] = pdf_urls['analysis_url']
         
         update_data['metadata'] = update_data.get('metadata', {})
-        update_data['metadata'].update({
-            # Match Python script report_data keys
-            'consensus_damage_cm2': round(total_consensus_area, 1),
-            'Paint Costs Local': cost_data['paint_costs_local'],  # Match Python key
-            'Lights Repair Cost (Local)': round(cost_data['light_cost_local'], 2),
-            'Windshield Repair Cost (Local)': round(cost_data['windshield_cost_local'], 2),
-            'Tire Repair Cost (Local)': round(cost_data['tire_cost_local'], 2),
-            'Subtotal Cost (Local)': round(cost_data['subtotal_local_base'], 2),
-            'Tax Amount (Local)': round(cost_data['tax_amount_on_base_local'], 2),
-            'Subtotal Post Base Tax (Local)': round(cost_data['subtotal_post_base_tax'], 2),
-            'Luxury Factor': round(cost_data['luxury_index'], 2),
-            'Final Cost (Local)': round(cost_data['final_local_cost'], 2),
-            'Sindhu Damage (cm²)': round(t1_total, 1),
-            'CDDCE Damage (cm²)': round(t2_total, 1),
-            'Capstone Damage (cm²)': round(t3_total, 1),
-            'Tax Rate': cost_data['tax_rate'],
-            'Light Damage Found': global_has_light_damage,
-            'Windshield Damage Found': global_has_windshield_damage,
-            # Also keep shorter keys for API compatibility
-            'paint_costs': cost_data['paint_costs_local'],
-            'light_repair_cost': cost_data['light_cost_local'],
-            'windshield_repair_cost': cost_data['windshield_cost_local'],
-            'tire_repair_cost': cost_data['tire_cost_local'],
-            'sindhu_damage_cm2': round(t1_total, 1),
-            'cddce_damage_cm2': round(t2_total, 1),
-            'capstone_damage_cm2': round(t3_total, 1),
-        })
+        # Round each group in one NumPy pass; .tolist() hands back plain floats for JSON
+        consensus_cm2, sindhu_cm2, cddce_cm2, capstone_cm2 = np.round(
+            [total_consensus_area, t1_total, t2_total, t3_total], 1
+        ).tolist()
+        (light_cost, windshield_cost, tire_cost, subtotal, tax_amount,
+         subtotal_post_tax, luxury_factor, final_cost) = np.round([
+            cost_data.light_cost_local,
+            cost_data.windshield_cost_local,
+            cost_data.tire_cost_local,
+            cost_data.subtotal_local_base,
+            cost_data.tax_amount_on_base_local,
+            cost_data.subtotal_post_base_tax,
+            cost_data.luxury_index,
+            cost_data.final_local_cost,
+        ], 2).tolist()
+        update_data['metadata'].update(zip(_RESULT_METADATA_KEYS, (
+            'Assessment processing completed!',
+            100,
+            consensus_cm2,
+            cost_data.paint_costs_local,
+            light_cost,
+            windshield_cost,
+            tire_cost,
+            subtotal,
+            tax_amount,
+            subtotal_post_tax,
+            luxury_factor,
+            final_cost,
+            sindhu_cm2,
+            cddce_cm2,
+            capstone_cm2,
+            cost_data.tax_rate,
+            global_has_light_damage,
+            global_has_windshield_damage,
+            cost_data.paint_costs_local,
+            cost_data.light_cost_local,
+            cost_data.windshield_cost_local,
+            cost_data.tire_cost_local,
+            sindhu_cm2,
+            cddce_cm2,
+            capstone_cm2,
+        )))
         
         try:
-            response = self.supabase.table('assessments').update(update_data).eq('id', assessment_id).execute()
+            response = await asyncio.to_thread(
+                self.supabase.table('assessments').update(update_data).eq('id', assessment_id).execute
+            )
+            self._metadata_cache[assessment_id] = update_data['metadata']
             if response.data:
                 print(f"✅ Results saved to Supabase for assessment {assessment_id}")
-                print(f"   Final Cost: {cost_data['final_local_cost']:.2f} {cost_data['currency']}")
+                print(f"   Final Cost: {cost_data.final_local_cost:.2f} {cost_data.currency}")
                 print(f"   Consensus Damage: {total_consensus_area:.1f} cm²")
             else:
                 print(f"⚠️  No data returned from Supabase update")
-        except Exception as e:
-            print(f"❌ Error saving results to Supabase: {e}")
-            import traceback
-            traceback.print_exc()
+        except Exception:
+            # The handler formats the stack only when it emits the record
+            log.exception("❌ Error saving results to Supabase for assessment %s", assessment_id)
             raise  # Re-raise to mark assessment as failed
+
+
+@lru_cache(maxsize=1)
+def get_processor() -> DamageProcessor:
+    """
+    Return the process-wide DamageProcessor, creating it on first use.
+    Sharing it keeps loaded models, the HTTP pool and caches across assessments.
+    """
+    return DamageProcessor()
@@ -4,39 +4,52 @@ Run this locally to test before deploying
 """
 
 import requests
+from requests.adapters import HTTPAdapter
+from concurrent.futures import ThreadPoolExecutor, as_completed
 import json
 
 BASE_URL = "https://baseer-backend.onrender.com"
 
+# One pooled session: the TLS handshake to Render is paid once, not per request
+session = requests.Session()
+session.mount("https://", HTTPAdapter(pool_connections=4, pool_maxsize=4))
+
 def test_endpoint(url, method="GET", data=None):
     """Test an endpoint and print results"""
+    # Each report is printed in one call so concurrent tests don't interleave
     try:
         if method == "GET":
-            response = requests.get(url, timeout=30)
+            response = session.get(url, timeout=30)
         else:
-            response = requests.post(url, data=data, timeout=30)
+            response = session.post(url, data=data, timeout=30)
         
-        print(f"\n{'='*60}")
-        print(f"Testing: {method} {url}")
-        print(f"Status: {response.status_code}")
-        print(f"Response: {json.dumps(response.json(), indent=2)}")
+        print(
+            f"\n{'='*60}\n"
+            f"Testing: {method} {url}\n"
+            f"Status: {response.status_code}\n"
+            f"Response: {json.dumps(response.json(), indent=2)}"
+        )
         return response.status_code == 200
     except Exception as e:
-        print(f"\n{'='*60}")
-        print(f"Error testing {url}: {e}")
+        print(f"\n{'='*60}\nError testing {url}: {e}")
         return False
 
 if __name__ == "__main__":
     print("Testing Render Server Endpoints...")
     
-    # Test root
-    test_endpoint(f"{BASE_URL}/")
-    
-    # Test health
-    test_endpoint(f"{BASE_URL}/health")
+    tests = [
+        # Test root
+        (f"{BASE_URL}/", "GET", None),
+        # Test health
+        (f"{BASE_URL}/health", "GET", None),
+        # Test predict (will fail if endpoint doesn't exist)
+        (f"{BASE_URL}/predict", "POST", "test"),
+    ]
     
-    # Test predict (will fail if endpoint doesn't exist)
-    test_endpoint(f"{BASE_URL}/predict", method="POST", data="test")
+    with ThreadPoolExecutor(max_workers=len(tests)) as executor:
+        futures = [executor.submit(test_endpoint, url, method, data) for url, method, data in tests]
+        for future in as_completed(futures):
+            future.result()
     
     print("\n" + "="*60)
     print("Testing complete!")
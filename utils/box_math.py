@@ -0,0 +1,148 @@
+"""
+Box Math - small per-photo box kernels
+Uses Numba when it is installed (fused loops, no (N, M) temporaries);
+otherwise falls back to the equivalent NumPy broadcast.
+"""
+
+import numpy as np
+
+try:
+    from numba import njit
+    HAS_NUMBA = True
+except ImportError:  # optional dependency
+    HAS_NUMBA = False
+
+
+def _paint_area_numpy(damage_xyxy: np.ndarray, tire_xyxy: np.ndarray, scale2: float):
+    damage_area_px = (damage_xyxy[:, 2] - damage_xyxy[:, 0]) * (damage_xyxy[:, 3] - damage_xyxy[:, 1])
+    hit = np.zeros(len(damage_xyxy), dtype=bool)
+    if len(tire_xyxy):
+        d, t = damage_xyxy, tire_xyxy
+        xi1 = np.maximum(d[:, None, 0], t[None, :, 0])
+        yi1 = np.maximum(d[:, None, 1], t[None, :, 1])
+        xi2 = np.minimum(d[:, None, 2], t[None, :, 2])
+        yi2 = np.minimum(d[:, None, 3], t[None, :, 3])
+        inter = np.clip(xi2 - xi1, 0, None) * np.clip(yi2 - yi1, 0, None)
+        hit = (inter / (damage_area_px[:, None] + 1e-6) > 0.5).any(axis=1)
+    return float(damage_area_px[~hit].sum()) * scale2, bool(hit.any())
+
+
+def _paint_area_loop(damage_xyxy, tire_xyxy, scale2):
+    total = 0.0
+    has_tire = False
+    for i in range(damage_xyxy.shape[0]):
+        x1, y1, x2, y2 = damage_xyxy[i, 0], damage_xyxy[i, 1], damage_xyxy[i, 2], damage_xyxy[i, 3]
+        darea = (x2 - x1) * (y2 - y1)
+        hit = False
+        for j in range(tire_xyxy.shape[0]):
+            iw = min(x2, tire_xyxy[j, 2]) - max(x1, tire_xyxy[j, 0])
+            ih = min(y2, tire_xyxy[j, 3]) - max(y1, tire_xyxy[j, 1])
+            if iw > 0 and ih > 0 and iw * ih / (darea + 1e-6) > 0.5:
+                hit = True
+                break
+        if hit:
+            has_tire = True
+        else:
+            total += darea
+    return total * scale2, has_tire
+
+
+_paint_area_kernel = njit(cache=True)(_paint_area_loop) if HAS_NUMBA else None
+
+
+def paint_area(damage_xyxy: np.ndarray, tire_xyxy: np.ndarray, scale_cm_per_px: float):
+    """
+    Paint area (cm²) of damage boxes not mostly (>50%) inside a tire box.
+    
+    Args:
+        damage_xyxy: (N, 4) float64 damage boxes
+        tire_xyxy: (M, 4) float64 tire boxes
+        scale_cm_per_px: Photo scale
+    
+    Returns: (paint_area_cm2, has_tire_damage)
+    """
+    scale2 = scale_cm_per_px ** 2
+    if _paint_area_kernel is not None:
+        total, has_tire = _paint_area_kernel(damage_xyxy, tire_xyxy, scale2)
+        return float(total), bool(has_tire)
+    return _paint_area_numpy(damage_xyxy, tire_xyxy, scale2)
+
+
+def _consensus_groups_numpy(xyxy: np.ndarray, iou_threshold: float):
+    n = len(xyxy)
+    areas = (xyxy[:, 2] - xyxy[:, 0]) * (xyxy[:, 3] - xyxy[:, 1])
+    # Boxes sorted by left edge: only those starting left of a pivot's right
+    # edge can overlap it, so IoU is computed on that prefix, not all N boxes
+    order = np.argsort(xyxy[:, 0], kind='stable')
+    x1_sorted = xyxy[order, 0]
+    group = np.full(n, -1, dtype=np.int64)
+    used = np.zeros(n, dtype=bool)
+    for i in range(n):
+        if used[i]:
+            continue
+        used[i] = True
+        x1, y1, x2, y2 = xyxy[i]
+        cand = order[:np.searchsorted(x1_sorted, x2, side='left')]
+        # Later unused boxes that also overlap on the remaining three edges
+        cand = cand[
+            (cand > i) & ~used[cand]
+            & (xyxy[cand, 2] > x1) & (xyxy[cand, 1] < y2) & (xyxy[cand, 3] > y1)
+        ]
+        if not len(cand):
+            continue
+        b = xyxy[cand]
+        inter = (np.minimum(b[:, 2], x2) - np.maximum(b[:, 0], x1)) * (np.minimum(b[:, 3], y2) - np.maximum(b[:, 1], y1))
+        union = areas[i] + areas[cand] - inter
+        # Pairs with a non-positive union never match
+        iou = np.divide(inter, union, out=np.zeros_like(inter), where=union > 0)
+        peers = cand[iou > iou_threshold]
+        if len(peers):
+            used[peers] = True
+            group[i] = i
+            group[peers] = i
+    return group
+
+
+def _consensus_groups_loop(xyxy, iou_threshold):
+    # Computes each pivot's IoU row on the fly: O(N) memory instead of the (N, N) matrix
+    n = xyxy.shape[0]
+    group = np.full(n, -1, dtype=np.int64)
+    used = np.zeros(n, dtype=np.bool_)
+    for i in range(n):
+        if used[i]:
+            continue
+        used[i] = True
+        x1, y1, x2, y2 = xyxy[i, 0], xyxy[i, 1], xyxy[i, 2], xyxy[i, 3]
+        area_i = (x2 - x1) * (y2 - y1)
+        for j in range(i + 1, n):
+            if used[j]:
+                continue
+            iw = max(0, min(x2, xyxy[j, 2]) - max(x1, xyxy[j, 0]))
+            ih = max(0, min(y2, xyxy[j, 3]) - max(y1, xyxy[j, 1]))
+            inter = iw * ih
+            union = area_i + (xyxy[j, 2] - xyxy[j, 0]) * (xyxy[j, 3] - xyxy[j, 1]) - inter
+            if union > 0 and inter / union > iou_threshold:
+                used[j] = True
+                group[i] = i
+                group[j] = i
+    return group
+
+
+_consensus_groups_kernel = njit(cache=True)(_consensus_groups_loop) if HAS_NUMBA else None
+
+
+def consensus_groups(xyxy: np.ndarray, iou_threshold: float) -> np.ndarray:
+    """
+    Greedy IoU grouping in box order: each unused box claims every later unused
+    box overlapping it by more than iou_threshold.
+    
+    Args:
+        xyxy: (N, 4) boxes
+        iou_threshold: IoU a pair must exceed to match
+    
+    Returns: (N,) int64 array holding each box's group pivot index
+             (the group's first box), or -1 for boxes that matched nothing
+    """
+    if _consensus_groups_kernel is not None:
+        return _consensus_groups_kernel(xyxy, iou_threshold)
+    return _consensus_groups_numpy(xyxy, iou_threshold)
@@ -0,0 +1,44 @@
+"""
+Detection Categories - class-name substring checks precomputed per model
+Maps class ids to bit flags so per-box category tests are integer lookups
+"""
+
+import numpy as np
+from functools import lru_cache
+from typing import Dict, Tuple
+
+HANDLE = 1 << 0
+TIRE = 1 << 1
+HEADLIGHT = 1 << 2
+LICENSE = 1 << 3
+WINDSHIELD = 1 << 4
+LIGHT = 1 << 5
+
+@lru_cache(maxsize=32)
+def _build_cat_table(names: Tuple[Tuple[int, str], ...]) -> np.ndarray:
+    """int8 array of category flags indexed by class id"""
+    table = np.zeros(max(cid for cid, _ in names) + 1 if names else 0, dtype=np.int8)
+    for cid, name in names:
+        n = name.lower()
+        table[cid] = (
+            (HANDLE if "handle" in n else 0)
+            | (TIRE if "wheel" in n or "tire" in n else 0)
+            | (HEADLIGHT if "headlight" in n else 0)
+            | (LICENSE if "license" in n or "plate" in n else 0)
+            | (WINDSHIELD if "windshield" in n else 0)
+            | (LIGHT if "light" in n else 0)
+        )
+    return table
+
+def category_flags(names: Dict[int, str], cls: np.ndarray) -> np.ndarray:
+    """
+    Category flags for each box.
+
+    Args:
+        names: Model class names (YOLO result .names)
+        cls: Integer class ids of the boxes
+
+    Returns:
+        int8 array of HANDLE/TIRE/HEADLIGHT/LICENSE/WINDSHIELD/LIGHT bits per box
+    """
+    return _build_cat_table(tuple(names.items()))[cls]
@@ -5,112 +5,75 @@ Combines results from multiple YOLO models using IoU-based matching
 
 import numpy as np
 from typing import List, Dict
+from app.utils.box_math import consensus_groups
+from app.utils.categories import category_flags, WINDSHIELD, LIGHT
 
 def get_multi_model_consensus(results_list: List, iou_threshold: float = 0.5) -> List[Dict]:
     """
     Get consensus damage detection from multiple models.
     Only damage detected by 2+ models is counted.
-    
+
     Args:
         results_list: List of YOLO results objects
         iou_threshold: IoU threshold for matching boxes (default 0.5)
-    
+
     Returns:
         List of consensus damage items with bounding boxes and metadata
     """
-    all_boxes = []
-    
-    # Collect all boxes from all models
+    # Collect all boxes from all models as parallel arrays (one device->host copy per model)
+    xyxy_parts, conf_parts, cls_parts, flag_parts = [], [], [], []
+    sources = []
     for res in results_list:
-        if res.boxes is not None:
-            for box in res.boxes:
-                all_boxes.append({
-                    'xyxy': box.xyxy[0].cpu().numpy(),
-                    'conf': box.conf.item(),
-                    'cls': int(box.cls.item()),
-                    'source': res,
-                    'class_name': res.names[int(box.cls.item())]
-                })
-    
+        if res.boxes is not None and len(res.boxes):
+            cls = res.boxes.cls.cpu().numpy().astype(int)
+            # float32 end to end (no-op for standard exports, converts FP16 engine outputs)
+            xyxy_parts.append(res.boxes.xyxy.cpu().numpy().astype(np.float32, copy=False))
+            conf_parts.append(res.boxes.conf.cpu().numpy().astype(np.float32, copy=False))
+            cls_parts.append(cls)
+            flag_parts.append(category_flags(res.names, cls))
+            sources.extend([res] * len(cls))
+
+    if not sources:
+        return []
+
+    xyxy = np.concatenate(xyxy_parts)
+    conf = np.concatenate(conf_parts)
+    cls = np.concatenate(cls_parts)
+    flags = np.concatenate(flag_parts)
+    is_windshield = (flags & WINDSHIELD) != 0
+    is_light = (flags & LIGHT) != 0
+    is_other = ~is_windshield & ~is_light
+
+    # Greedy matching in detection order: each unused box claims every unused box overlapping it
+    group = consensus_groups(xyxy, iou_threshold)
+
     consensus = []
-    used = [False] * len(all_boxes)
-    
-    # Match boxes using IoU
-    for i, b1 in enumerate(all_boxes):
-        if used[i]:
-            continue
-        
-        matches = [b1]
-        
-        for j, b2 in enumerate(all_boxes):
-            if i == j or used[j]:
-                continue
-            
-            # Calculate IoU
-            xi1 = max(b1['xyxy'][0], b2['xyxy'][0])
-            yi1 = max(b1['xyxy'][1], b2['xyxy'][1])
-            xi2 = min(b1['xyxy'][2], b2['xyxy'][2])
-            yi2 = min(b1['xyxy'][3], b2['xyxy'][3])
-            
-            inter = max(0, xi2 - xi1) * max(0, yi2 - yi1)
-            box1_area = (b1['xyxy'][2] - b1['xyxy'][0]) * (b1['xyxy'][3] - b1['xyxy'][1])
-            box2_area = (b2['xyxy'][2] - b2['xyxy'][0]) * (b2['xyxy'][3] - b2['xyxy'][1])
-            union = box1_area + box2_area - inter
-            
-            if union > 0 and inter / union > iou_threshold:
-                matches.append(b2)
-                used[j] = True
-        
-        # Only add to consensus if 2+ models agree
-        if len(matches) >= 2:
-            avg_box = np.mean([m['xyxy'] for m in matches], axis=0)
-            current_consensus_items = []
-            
-            # Check for Windshield consensus
-            windshield_count = sum(1 for m in matches if 'windshield' in m['class_name'].lower())
-            if windshield_count >= 2:
-                current_consensus_items.append({
-                    'xyxy': avg_box,
-                    'conf': np.mean([m['conf'] for m in matches]),
-                    'cls': matches[0]['cls'],
-                    'model_names': matches[0]['source'].names,
-                    'detected_class': 'Windshield',
-                    'is_windshield': True,
-                    'is_light': False
-                })
-            
-            # Check for Light consensus
-            light_count = sum(1 for m in matches if 'light' in m['class_name'].lower())
-            if light_count >= 2:
-                current_consensus_items.append({
-                    'xyxy': avg_box,
-                    'conf': np.mean([m['conf'] for m in matches]),
-                    'cls': matches[0]['cls'],
-                    'model_names': matches[0]['source'].names,
-                    'detected_class': 'Light',
-                    'is_windshield': False,
-                    'is_light': True
-                })
-            
-            # Check for other damage consensus
-            has_specific_damage = (windshield_count >= 2) or (light_count >= 2)
-            if not has_specific_damage:
-                other_damage_count = sum(1 for m in matches
-                                       if 'windshield' not in m['class_name'].lower() and
-                                          'light' not in m['class_name'].lower())
-                if other_damage_count >= 2:
-                    current_consensus_items.append({
-                        'xyxy': avg_box,
-                        'conf': np.mean([m['conf'] for m in matches]),
-                        'cls': matches[0]['cls'],
-                        'model_names': matches[0]['source'].names,
-                        'detected_class': 'Damage',
-                        'is_windshield': False,
-                        'is_light': False
-                    })
-            
-            consensus.extend(current_consensus_items)
-        
-        used[i] = True
-    
+
+    # Every group holds 2+ boxes, i.e. 2+ model detections agree.
+    # Pivots come out in detection order, each listed first in its group.
+    for i in np.flatnonzero(group == np.arange(len(group))):
+        matches = np.flatnonzero(group == i)
+        avg_box = xyxy[matches].mean(axis=0, dtype=np.float32)
+        avg_conf = conf[matches].mean(dtype=np.float32)
+        common = {
+            'xyxy': avg_box,
+            'conf': avg_conf,
+            'cls': int(cls[i]),
+            'model_names': sources[i].names,
+        }
+
+        # Check for Windshield consensus
+        has_windshield = np.count_nonzero(is_windshield[matches]) >= 2
+        if has_windshield:
+            consensus.append({**common, 'detected_class': 'Windshield', 'is_windshield': True, 'is_light': False})
+
+        # Check for Light consensus
+        has_light = np.count_nonzero(is_light[matches]) >= 2
+        if has_light:
+            consensus.append({**common, 'detected_class': 'Light', 'is_windshield': False, 'is_light': True})
+
+        # Check for other damage consensus
+        if not (has_windshield or has_light) and np.count_nonzero(is_other[matches]) >= 2:
+            consensus.append({**common, 'detected_class': 'Damage', 'is_windshield': False, 'is_light': False})
+
     return consensus
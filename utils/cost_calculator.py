@@ -3,8 +3,48 @@ Cost Calculator - Ported from Python V3.8 code
 Calculates repair costs based on damage areas and component replacements
 """
 
+import numpy as np
+from dataclasses import dataclass
 from typing import List, Dict, Tuple
 
+@dataclass(frozen=True, slots=True)
+class CostBreakdown:
+    """Full cost breakdown for one assessment (JOD and local currency)"""
+    paint_costs_jod: List[Tuple[int, float, float]]
+    paint_costs_local: List[Tuple[int, float, float]]
+    paint_total_jod: float
+    light_cost_jod: float
+    light_cost_local: float
+    windshield_cost_jod: float
+    windshield_cost_local: float
+    tire_cost_jod: float
+    tire_cost_local: float
+    subtotal_jod_base: float
+    subtotal_local_base: float
+    tax_rate: float
+    tax_amount_on_base_local: float
+    subtotal_post_base_tax: float
+    luxury_index: float
+    country_lux_factor: float
+    final_local_cost: float
+    currency: str
+
+# Breakdown for an assessment with no paint cost and no component damage
+_ZERO_COST_TEMPLATE = {
+    'paint_total_jod': 0.0,
+    'light_cost_jod': 0.0,
+    'light_cost_local': 0.0,
+    'windshield_cost_jod': 0.0,
+    'windshield_cost_local': 0.0,
+    'tire_cost_jod': 0.0,
+    'tire_cost_local': 0.0,
+    'subtotal_jod_base': 0.0,
+    'subtotal_local_base': 0.0,
+    'tax_amount_on_base_local': 0.0,
+    'subtotal_post_base_tax': 0.0,
+    'final_local_cost': 0.0,
+}
+
 def calculate_costs(
     photo_results: List[Dict],
     paint_costs_jod: List[Tuple[int, float, float]],  # (photo_num, area_cm2, cost_jod)
@@ -16,7 +56,7 @@ def calculate_costs(
     luxury_index: float,
     country_lux_factor: float,
     currency: str
-) -> Dict:
+) -> CostBreakdown:
     """
     Calculate total repair costs.
     
@@ -33,10 +73,28 @@ def calculate_costs(
     4. Apply luxury factors
     
     Returns:
-        Dict with all cost breakdown
+        CostBreakdown with all cost fields
     """
+    # Nothing to price (every photo has zero paint cost, no component damage):
+    # every term of the chain below would be zero. Photos are still listed.
+    if not any(cost for _, _, cost in paint_costs_jod) and not (
+        global_has_windshield_damage or global_has_light_damage or global_has_tire_damage
+    ):
+        return CostBreakdown(
+            **_ZERO_COST_TEMPLATE,
+            paint_costs_jod=paint_costs_jod,
+            paint_costs_local=[(int(photo_num), float(area), 0.0) for photo_num, area, _ in paint_costs_jod],
+            tax_rate=country_tax_rate,
+            luxury_index=luxury_index,
+            country_lux_factor=country_lux_factor,
+            currency=currency,
+        )
+    
+    # Paint costs as one (N, 3) array: photo_num, area_cm2, cost_jod
+    paint = np.asarray(paint_costs_jod, dtype=np.float64).reshape(-1, 3)
+    
     # Paint costs total
-    paint_total_jod = sum(cost for _, _, cost in paint_costs_jod)
+    paint_total_jod = float(paint[:, 2].sum())
     
     # Component costs (charged once globally)
     light_cost_jod = 30.0 if global_has_light_damage else 0.0
@@ -59,28 +117,32 @@ def calculate_costs(
     final_local_cost = subtotal_post_base_tax * luxury_index * country_lux_factor
     
     # Individual costs in local currency
-    paint_costs_local = [(num, area, cost * jod_to_local) for num, area, cost in paint_costs_jod]
+    paint_costs_local = list(zip(
+        paint[:, 0].astype(int).tolist(),
+        paint[:, 1].tolist(),
+        (paint[:, 2] * jod_to_local).tolist()
+    ))
     light_cost_local = light_cost_jod * jod_to_local
     windshield_cost_local = windshield_cost_jod * jod_to_local
     tire_cost_local = tire_cost_jod * jod_to_local
     
-    return {
-        'paint_costs_jod': paint_costs_jod,
-        'paint_costs_local': paint_costs_local,
-        'paint_total_jod': paint_total_jod,
-        'light_cost_jod': light_cost_jod,
-        'light_cost_local': light_cost_local,
-        'windshield_cost_jod': windshield_cost_jod,
-        'windshield_cost_local': windshield_cost_local,
-        'tire_cost_jod': tire_cost_jod,
-        'tire_cost_local': tire_cost_local,
-        'subtotal_jod_base': subtotal_jod_base,
-        'subtotal_local_base': subtotal_local_base,
-        'tax_rate': country_tax_rate,
-        'tax_amount_on_base_local': tax_amount_on_base_local,
-        'subtotal_post_base_tax': subtotal_post_base_tax,
-        'luxury_index': luxury_index,
-        'country_lux_factor': country_lux_factor,
-        'final_local_cost': final_local_cost,
-        'currency': currency,
-    }
+    return CostBreakdown(
+        paint_costs_jod=paint_costs_jod,
+        paint_costs_local=paint_costs_local,
+        paint_total_jod=paint_total_jod,
+        light_cost_jod=light_cost_jod,
+        light_cost_local=light_cost_local,
+        windshield_cost_jod=windshield_cost_jod,
+        windshield_cost_local=windshield_cost_local,
+        tire_cost_jod=tire_cost_jod,
+        tire_cost_local=tire_cost_local,
+        subtotal_jod_base=subtotal_jod_base,
+        subtotal_local_base=subtotal_local_base,
+        tax_rate=country_tax_rate,
+        tax_amount_on_base_local=tax_amount_on_base_local,
+        subtotal_post_base_tax=subtotal_post_base_tax,
+        luxury_index=luxury_index,
+        country_lux_factor=country_lux_factor,
+        final_local_cost=final_local_cost,
+        currency=currency,
+    )
@@ -3,26 +3,119 @@ Model Loader - Downloads and loads YOLO models from Supabase Storage
 """
 
 import os
+import asyncio
+import hashlib
+import importlib.util
 import httpx
 import aiofiles
+import torch
 from ultralytics import YOLO
 from app.config import config
 from typing import Dict, Optional
 
 # Cache loaded models
 _models_cache: Dict[str, YOLO] = {}
+# Serializes load_models so concurrent assessments don't export the same model twice
+_load_lock = asyncio.Lock()
 
-async def download_model_from_supabase(model_name: str, model_path: str) -> bool:
+# Process-wide HTTP client for model downloads: keep-alive (and HTTP/2 when the
+# optional 'h2' package is installed) saves a TLS handshake per model
+_client: Optional[httpx.AsyncClient] = None
+
+def _get_client() -> httpx.AsyncClient:
+    global _client
+    if _client is None or _client.is_closed:
+        _client = httpx.AsyncClient(
+            http2=importlib.util.find_spec('h2') is not None,
+            timeout=300.0,  # 5 minute timeout for large files
+            limits=httpx.Limits(max_keepalive_connections=4, max_connections=8)
+        )
+    return _client
+
+async def aclose() -> None:
+    """Close the shared download client (called on app shutdown)"""
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
+
+# What Ultralytics writes next to the .pt for each export format
+# (OpenVINO exports a directory holding the IR)
+_EXPORT_SUFFIXES = {'onnx': '.onnx', 'engine': '.engine', 'openvino': '_openvino_model'}
+
+def _resolve_backend() -> str:
+    """Map ENGINE=auto to TensorRT on GPU hosts and OpenVINO on CPU hosts"""
+    if config.ENGINE_BACKEND == 'auto':
+        return 'engine' if torch.cuda.is_available() else 'openvino'
+    return config.ENGINE_BACKEND
+
+def export_model(model_path: str, int8: bool = False) -> str:
+    """
+    Export a .pt model to config.ENGINE_BACKEND, reusing a cached artifact.
+    Batched OpenVINO models run in THROUGHPUT mode (Ultralytics drives an
+    AsyncInferQueue when called with batch > 1).
+    
+    Args:
+        model_path: Local path of the .pt model
+        int8: Post-training INT8 quantization (TensorRT/OpenVINO only), calibrated
+              on config.ENGINE_INT8_DATA; ignored when that is not set
+    
+    Returns:
+        Path of the exported model, or model_path if exporting is disabled or fails
+    """
+    backend = _resolve_backend()
+    if backend not in _EXPORT_SUFFIXES:
+        return model_path
+    
+    exported_path = os.path.splitext(model_path)[0] + _EXPORT_SUFFIXES[backend]
+    if os.path.exists(exported_path) and os.path.getmtime(exported_path) >= os.path.getmtime(model_path):
+        return exported_path
+    
+    int8 = int8 and backend in ('engine', 'openvino') and bool(config.ENGINE_INT8_DATA)
+    quantization = {'int8': True, 'data': config.ENGINE_INT8_DATA} if int8 else {}
+    
+    try:
+        print(f"Exporting {model_path} to {backend}{' (INT8)' if int8 else ''} (first boot only)...")
+        # FP16 export needs a GPU; Ultralytics rejects half+dynamic ONNX on CPU
+        return YOLO(model_path).export(
+            format=backend,
+            imgsz=config.ENGINE_IMGSZ,
+            half=torch.cuda.is_available() and not int8,
+            dynamic=True,
+            batch=config.MAX_PHOTOS_PER_ASSESSMENT,  # TensorRT profile max batch
+            simplify=True,
+            **quantization
+        )
+    except Exception as e:
+        print(f"Warning: {backend} export failed for {model_path}, using PyTorch: {e}")
+        return model_path
+
+async def _fetch_expected_sha256(model_url: str, client: httpx.AsyncClient) -> Optional[str]:
+    """Read the `<model>.sha256` sidecar stored next to the model, if there is one"""
+    try:
+        response = await client.get(model_url + '.sha256')
+        if response.status_code != 200:
+            return None
+        # Accept both a bare digest and `sha256sum` output ("<digest>  best.pt")
+        return response.text.split()[0].lower()
+    except Exception:
+        return None
+
+async def download_model_from_supabase(model_name: str, model_path: str, client: Optional[httpx.AsyncClient] = None) -> bool:
     """
-    Download a YOLO model from Supabase Storage.
+    Download a YOLO model from Supabase Storage, streaming it to disk.
+    Verifies the SHA256 from a `best.pt.sha256` sidecar when the bucket has one
+    and resumes interrupted downloads with an HTTP Range request.
     
     Args:
         model_name: Name of the model (e.g., 'handle', 'component')
         model_path: Local path to save the model
+        client: HTTP client to download with (defaults to the shared module client)
     
     Returns:
         True if successful, False otherwise
     """
+    client = client or _get_client()
     try:
         # Construct Supabase Storage URL
         # Format: https://PROJECT_ID.supabase.co/storage/v1/object/public/BUCKET_NAME/PATH
@@ -39,14 +132,49 @@ async def download_model_from_supabase(model_name: str, model_path: str) -> bool
         # Create directory if needed
         os.makedirs(os.path.dirname(model_path), exist_ok=True)
         
-        # Download model
-        async with httpx.AsyncClient(timeout=300.0) as client:  # 5 minute timeout for large files
-            response = await client.get(model_url)
-            response.raise_for_status()
-            
-            # Save to disk
-            async with aiofiles.open(model_path, 'wb') as f:
-                await f.write(response.content)
+        # Download into a .part file; an interrupted download resumes from where it stopped
+        part_path = model_path + '.part'
+        resume_from = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        hasher = hashlib.sha256()
+        if resume_from:
+            async with aiofiles.open(part_path, 'rb') as f:
+                while chunk := await f.read(1 << 20):
+                    hasher.update(chunk)
+        
+        expected_sha256 = await _fetch_expected_sha256(model_url, client)
+        headers = {'Range': f'bytes={resume_from}-'} if resume_from else None
+        
+        # Download model in 1 MiB chunks (memory stays flat regardless of model size)
+        async with client.stream('GET', model_url, headers=headers) as response:
+            if response.status_code == 416:
+                # .part already holds the whole file
+                pass
+            else:
+                response.raise_for_status()
+                mode = 'ab'
+                if resume_from and response.status_code != 206:
+                    # Server ignored the Range header; start over
+                    print(f"Server does not support resume for {model_name}, restarting download")
+                    hasher = hashlib.sha256()
+                    mode = 'wb'
+                elif resume_from:
+                    print(f"Resuming {model_name} download at {resume_from} bytes")
+                
+                # Save to disk
+                async with aiofiles.open(part_path, mode) as f:
+                    async for chunk in response.aiter_bytes(1 << 20):
+                        hasher.update(chunk)
+                        await f.write(chunk)
+        
+        if expected_sha256 is None:
+            print(f"Warning: no SHA256 sidecar for {model_name}, skipping integrity check")
+        elif hasher.hexdigest() != expected_sha256:
+            os.remove(part_path)
+            print(f"Error downloading {model_name}: SHA256 mismatch (expected {expected_sha256}, got {hasher.hexdigest()})")
+            return False
+        
+        # Only a complete, verified file ever appears at model_path
+        os.replace(part_path, model_path)
         
         print(f"Successfully downloaded {model_name} to {model_path}")
         return True
@@ -55,6 +183,10 @@ async def download_model_from_supabase(model_name: str, model_path: str) -> bool
         print(f"Error downloading {model_name}: {e}")
         return False
 
+def _export_and_load(model_path: str, int8: bool) -> YOLO:
+    """Export (if enabled) and load one model; blocking"""
+    return YOLO(export_model(model_path, int8=int8))
+
 async def load_models() -> Dict[str, YOLO]:
     """
     Load all YOLO models. Downloads from Supabase if not cached.
@@ -62,33 +194,45 @@ async def load_models() -> Dict[str, YOLO]:
     Returns:
         Dict of model_name -> YOLO model
     """
-    global _models_cache
-    
-    models = {}
-    
-    for model_name, model_path in config.MODEL_PATHS.items():
-        # Check if already loaded
-        if model_name in _models_cache:
-            models[model_name] = _models_cache[model_name]
-            continue
+    async with _load_lock:
+        models = {}
         
-        # Check if file exists locally
-        if not os.path.exists(model_path):
-            print(f"Model {model_name} not found locally, downloading from Supabase...")
-            success = await download_model_from_supabase(model_name, model_path)
-            if not success:
+        # Download every missing model concurrently before loading
+        missing = [
+            (model_name, model_path) for model_name, model_path in config.MODEL_PATHS.items()
+            if model_name not in _models_cache and not os.path.exists(model_path)
+        ]
+        failed = set()
+        if missing:
+            print(f"Models not found locally, downloading from Supabase: {[name for name, _ in missing]}")
+            results = await asyncio.gather(
+                *(download_model_from_supabase(name, path) for name, path in missing)
+            )
+            failed = {name for (name, _), success in zip(missing, results) if not success}
+        
+        for model_name, model_path in config.MODEL_PATHS.items():
+            # Check if already loaded
+            if model_name in _models_cache:
+                models[model_name] = _models_cache[model_name]
+                continue
+            
+            if model_name in failed:
                 print(f"Warning: Failed to download {model_name}, skipping...")
                 continue
+            
+            # Load model
+            try:
+                print(f"Loading model: {model_name}")
+                # The 3 damage models dominate inference time; they get INT8 when calibration data is configured.
+                # Export (minutes on first boot when ENGINE is set) and load off the event loop.
+                model = await asyncio.to_thread(
+                    _export_and_load, model_path, model_name.startswith('damage_')
+                )
+                models[model_name] = model
+                _models_cache[model_name] = model
+                print(f"Successfully loaded {model_name}")
+            except Exception as e:
+                print(f"Error loading model {model_name}: {e}")
+                continue
         
-        # Load model
-        try:
-            print(f"Loading model: {model_name}")
-            model = YOLO(model_path)
-            models[model_name] = model
-            _models_cache[model_name] = model
-            print(f"Successfully loaded {model_name}")
-        except Exception as e:
-            print(f"Error loading model {model_name}: {e}")
-            continue
-    
-    return models
+        return models
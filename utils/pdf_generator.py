@@ -4,15 +4,19 @@ Generates invoice and analysis PDFs matching the original style
 """
 
 import os
+from io import BytesIO
+from concurrent.futures import Future
 from datetime import datetime
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
+from PIL import Image
 from reportlab.lib.pagesizes import A4
-from reportlab.platypus import SimpleDocTemplate, Paragraph, Spacer, Image as RLImage, Table, TableStyle
+from reportlab.platypus import SimpleDocTemplate, Paragraph, Preformatted, Spacer, Image as RLImage, Table, LongTable, TableStyle
 from reportlab.lib.styles import getSampleStyleSheet, ParagraphStyle
 from reportlab.lib.units import inch
 from reportlab.lib import colors
 from reportlab.lib.enums import TA_CENTER, TA_LEFT, TA_RIGHT
 from app.config import config
+from app.utils.cost_calculator import CostBreakdown
 
 
 # Dark blue color matching Python code
@@ -20,14 +24,102 @@ DARK_BLUE = colors.HexColor('#1b4a6b')
 LIGHT_BLUE_GRAY = colors.HexColor('#e8f4f8')
 MEDIUM_GRAY = colors.HexColor('#CCCCCC')
 
+# Paragraph styles are immutable once built; create them once at import
+_STYLES = getSampleStyleSheet()
+
+# Custom styles (matching Python code)
+_INVOICE_TITLE_STYLE = ParagraphStyle(
+    name='InvoiceTitle',
+    parent=_STYLES['Title'],
+    fontSize=36,
+    textColor=colors.whitesmoke,
+    alignment=TA_LEFT,
+    spaceAfter=0,
+    leading=40
+)
+
+_FOOTER_TEXT_STYLE = ParagraphStyle(
+    name='FooterText',
+    parent=_STYLES['Normal'],
+    fontSize=10,
+    textColor=colors.whitesmoke,
+    alignment=TA_CENTER,
+    spaceAfter=0,
+    leading=12
+)
+
+_SMALL_CAPTION_STYLE = ParagraphStyle(
+    name='Small',
+    parent=_STYLES['Normal'],
+    fontSize=8,
+    leading=10,
+    alignment=TA_CENTER
+)
+
+# Leading includes the 0.05" gap that used to follow each analysis line
+_MONO_STYLE = ParagraphStyle(
+    name='Mono',
+    fontName='Courier',
+    fontSize=8,
+    leading=9 + 0.05*inch,
+    alignment=TA_LEFT
+)
+# Courier 8pt is 4.8pt per character; wrap to the analysis PDF frame
+# (A4 minus 1" margins and 6pt frame padding each side)
+_MONO_LINE_CHARS = 91
+
+
+# Photos are embedded at this resolution for the largest photo slot (the
+# analysis PDF's 3.5" x 2.625"); phone photos are often 4000x3000, far more
+# pixels than a slot can show. Both PDFs share one prepared copy per photo.
+PDF_IMAGE_DPI = 200
+PDF_PHOTO_PX = (round(3.5 * PDF_IMAGE_DPI), round(2.625 * PDF_IMAGE_DPI))
+
+
+def _prep_image_for_pdf(image_path: str, width_px: int, height_px: int) -> bytes:
+    """JPEG bytes of the image shrunk to fit a width_px x height_px slot"""
+    with Image.open(image_path) as img:
+        if img.width <= width_px and img.height <= height_px and img.format == 'JPEG':
+            # Already small enough: embed the original bytes untouched
+            img.fp.seek(0)
+            return img.fp.read()
+        # JPEG draft mode lets libjpeg decode at a reduced scale first
+        img.draft('RGB', (width_px, height_px))
+        # RLImage stretches to the slot anyway, so fill it exactly (never upscale)
+        size = (min(img.width, width_px), min(img.height, height_px))
+        resized = img.convert('RGB').resize(size, Image.LANCZOS)
+    buf = BytesIO()
+    resized.save(buf, 'JPEG', quality=85)
+    return buf.getvalue()
+
+
+def _image_file(image_path: str, image_cache: Optional[Dict[str, Future]]) -> BytesIO:
+    """
+    File object for an RLImage, downscaled to PDF_PHOTO_PX.
+    The invoice and analysis PDFs are built concurrently from one shared cache:
+    the first thread to ask for a photo prepares it, the other waits for it.
+    """
+    if image_cache is None:
+        return BytesIO(_prep_image_for_pdf(image_path, *PDF_PHOTO_PX))
+    future = Future()
+    # dict.setdefault is atomic, so exactly one thread owns each photo
+    owner = image_cache.setdefault(image_path, future) is future
+    if owner:
+        try:
+            future.set_result(_prep_image_for_pdf(image_path, *PDF_PHOTO_PX))
+        except Exception as e:
+            future.set_exception(e)
+    return BytesIO(image_cache[image_path].result())
+
 
 def generate_invoice_pdf(
     report_id: str,
     pdf_path: str,
     photo_results: List[Dict],
-    cost_data: Dict,
+    cost_data: CostBreakdown,
     report_data: Dict,
-    logo_path: str = None
+    logo_path: str = None,
+    image_cache: Optional[Dict[str, Future]] = None
 ) -> str:
     """
     Generate invoice PDF matching Python V3.8 style.
@@ -38,6 +130,7 @@ def generate_invoice_pdf(
         photo_results: List of photo processing results with consensus_path
         cost_data: Cost calculation data
         report_data: Additional report metadata
+        image_cache: Prepared photos by path, shared with generate_analysis_pdf
         
     Returns:
         Path to generated PDF
@@ -54,37 +147,7 @@ def generate_invoice_pdf(
             topMargin=1.5*inch,
             bottomMargin=1*inch
         )
-        styles = getSampleStyleSheet()
-        
-        # Custom styles (matching Python code)
-        invoice_title_style = ParagraphStyle(
-            name='InvoiceTitle',
-            parent=styles['Title'],
-            fontSize=36,
-            textColor=colors.whitesmoke,
-            alignment=TA_LEFT,
-            spaceAfter=0,
-            leading=40
-        )
-        
-        footer_text_style = ParagraphStyle(
-            name='FooterText',
-            parent=styles['Normal'],
-            fontSize=10,
-            textColor=colors.whitesmoke,
-            alignment=TA_CENTER,
-            spaceAfter=0,
-            leading=12
-        )
-        
-        small_caption_style = ParagraphStyle(
-            name='Small',
-            parent=styles['Normal'],
-            fontSize=8,
-            leading=10,
-            alignment=TA_CENTER
-        )
-        
+        styles = _STYLES
         story = []
         
         # Header and Footer functions
@@ -95,7 +158,7 @@ def generate_invoice_pdf(
             canvas.rect(0, A4[1] - 1.25*inch, A4[0], 1.25*inch, fill=1)
             
             # "INVOICE" text
-            invoice_para = Paragraph("<b>INVOICE</b>", invoice_title_style)
+            invoice_para = Paragraph("<b>INVOICE</b>", _INVOICE_TITLE_STYLE)
             invoice_para.wrapOn(canvas, 3*inch, 0.5*inch)
             invoice_para.drawOn(canvas, 0.75*inch, A4[1] - 1*inch)
             
@@ -115,7 +178,7 @@ def generate_invoice_pdf(
             # Footer
             canvas.setFillColor(DARK_BLUE)
             canvas.rect(0, 0, A4[0], 0.75*inch, fill=1)
-            footer_para = Paragraph("Thank you for your business!", footer_text_style)
+            footer_para = Paragraph("Thank you for your business!", _FOOTER_TEXT_STYLE)
             footer_para.wrapOn(canvas, A4[0], 0.75*inch)
             footer_para.drawOn(canvas, (A4[0] - footer_para.width) / 2, 0.25*inch)
             
@@ -181,69 +244,37 @@ def generate_invoice_pdf(
         story.append(Spacer(1, 0.2*inch))
         
         # Cost Breakdown Table
-        currency_symbol = cost_data.get('currency', 'JOD')
-        cost_breakdown_data = [
-            [Paragraph("<b>Item</b>", styles['Normal']), 
-             Paragraph("<b>Description</b>", styles['Normal']), 
-             Paragraph("<b>Amount</b>", styles['Normal'])],
+        currency_symbol = cost_data.currency
+        # Paint costs per photo, then other costs; only non-zero lines are billed
+        line_items = [
+            (f"Damage Repair Photo {photo_num}", cost)
+            for photo_num, _, cost in cost_data.paint_costs_local
+            if cost > 0
+        ] + [
+            (description, cost)
+            for description, cost in (
+                ("Lights Repair", cost_data.light_cost_local),
+                ("Windshield Replacement", cost_data.windshield_cost_local),
+                ("Tire Replacement", cost_data.tire_cost_local),
+            )
+            if cost > 0
         ]
         
-        item_count = 1
-        # Paint costs per photo
-        paint_costs = cost_data.get('paint_costs_local', [])
-        if isinstance(paint_costs, list):
-            for item in paint_costs:
-                if isinstance(item, (list, tuple)) and len(item) >= 3:
-                    photo_num, area, cost = item[0], item[1], item[2]
-                elif isinstance(item, dict):
-                    photo_num = item.get('photo_num', item_count)
-                    cost = item.get('cost', 0)
-                else:
-                    continue
-                    
-                if cost > 0:
-                    cost_breakdown_data.append([
-                        Paragraph(str(item_count), styles['Normal']),
-                        Paragraph(f"Damage Repair Photo {photo_num}", styles['Normal']),
-                        Paragraph(f"{cost:.2f}", styles['Normal'])
-                    ])
-                    item_count += 1
-        
-        # Other costs
-        if cost_data.get('light_cost_local', 0) > 0:
-            cost_breakdown_data.append([
-                Paragraph(str(item_count), styles['Normal']),
-                Paragraph("Lights Repair", styles['Normal']),
-                Paragraph(f"{cost_data['light_cost_local']:.2f}", styles['Normal'])
-            ])
-            item_count += 1
-            
-        if cost_data.get('windshield_cost_local', 0) > 0:
-            cost_breakdown_data.append([
-                Paragraph(str(item_count), styles['Normal']),
-                Paragraph("Windshield Replacement", styles['Normal']),
-                Paragraph(f"{cost_data['windshield_cost_local']:.2f}", styles['Normal'])
-            ])
-            item_count += 1
-            
-        if cost_data.get('tire_cost_local', 0) > 0:
-            cost_breakdown_data.append([
-                Paragraph(str(item_count), styles['Normal']),
-                Paragraph("Tire Replacement", styles['Normal']),
-                Paragraph(f"{cost_data['tire_cost_local']:.2f}", styles['Normal'])
-            ])
-            item_count += 1
+        cost_breakdown_data = [
+            # Header font comes from the table style
+            ["Item", "Description", "Amount"],
+            *([str(i), description, f"{cost:.2f}"] for i, (description, cost) in enumerate(line_items, 1)),
+        ]
         
         # Add empty rows if needed (to match style)
-        for _ in range(max(0, 4 - (len(cost_breakdown_data) - 1))):
-            cost_breakdown_data.append([
-                Paragraph("", styles['Normal']),
-                Paragraph("", styles['Normal']),
-                Paragraph("", styles['Normal'])
-            ])
-        
-        cost_breakdown_table = Table(cost_breakdown_data, colWidths=[0.5*inch, 3.5*inch, 2*inch])
+        cost_breakdown_data.extend([["", "", ""]] * max(0, 4 - len(line_items)))
+        
+        # LongTable: one layout pass for many rows; the header repeats on page breaks
+        cost_breakdown_table = LongTable(cost_breakdown_data, colWidths=[0.5*inch, 3.5*inch, 2*inch], repeatRows=1)
+        # Cells are plain strings (no paragraph layout pass); fonts set here
         cost_breakdown_table.setStyle(TableStyle([
+            ('FONTNAME', (0,0), (-1,-1), 'Helvetica'),
+            ('FONTSIZE', (0,0), (-1,-1), 10),
             ('BACKGROUND', (0,0), (-1,0), MEDIUM_GRAY),
             ('TEXTCOLOR', (0,0), (-1,0), colors.black),
             ('ALIGN', (0,0), (-1,-1), 'LEFT'),
@@ -259,21 +290,23 @@ def generate_invoice_pdf(
         story.append(Spacer(1, 0.5*inch))
         
         # Summary section
-        subtotal_local_base = cost_data.get('subtotal_local_base', 0)
-        tax_rate = cost_data.get('tax_rate', 0)
-        tax_amount_local = cost_data.get('tax_amount_on_base_local', 0)
-        final_local_cost = cost_data.get('final_local_cost', 0)
+        subtotal_local_base = cost_data.subtotal_local_base
+        tax_rate = cost_data.tax_rate
+        tax_amount_local = cost_data.tax_amount_on_base_local
+        final_local_cost = cost_data.final_local_cost
         
         summary_data = [
-            [Paragraph("Subtotal", styles['Normal']), Paragraph(f"{subtotal_local_base:.2f}", styles['Normal'])],
-            [Paragraph("Discount", styles['Normal']), Paragraph("$0.00", styles['Normal'])],
-            [Paragraph("Tax Rate", styles['Normal']), Paragraph(f"{tax_rate*100:.2f}%", styles['Normal'])],
-            [Paragraph("Tax", styles['Normal']), Paragraph(f"{tax_amount_local:.2f}", styles['Normal'])],
-            [Paragraph("<b>Total</b>", styles['Normal']), Paragraph(f"<b>{final_local_cost:.2f}</b>", styles['Normal'])],
+            ["Subtotal", f"{subtotal_local_base:.2f}"],
+            ["Discount", "$0.00"],
+            ["Tax Rate", f"{tax_rate*100:.2f}%"],
+            ["Tax", f"{tax_amount_local:.2f}"],
+            ["Total", f"{final_local_cost:.2f}"],
         ]
         
         summary_table = Table(summary_data, colWidths=[2*inch, 1*inch])
         summary_table.setStyle(TableStyle([
+            ('FONTNAME', (0,0), (-1,-1), 'Helvetica'),
+            ('FONTSIZE', (0,0), (-1,-1), 10),
             ('ALIGN', (0,0), (-1,-1), 'RIGHT'),
             ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
             ('FONTNAME', (0,-1), (-1,-1), 'Helvetica-Bold'),
@@ -304,8 +337,7 @@ def generate_invoice_pdf(
         story.append(Paragraph("The following photos show detected damage areas marked with bounding boxes:", styles['Normal']))
         story.append(Spacer(1, 0.2*inch))
         
-        elements_for_photos = []
-        photos_in_row = []
+        photo_cells = []
         
         for photo_result in photo_results:
             photo_num = photo_result.get('photo_num', 1)
@@ -317,62 +349,58 @@ def generate_invoice_pdf(
             
             if image_to_display and os.path.exists(image_to_display):
                 try:
-                    img = RLImage(image_to_display, width=3.2*inch, height=2.4*inch)
-                    img_caption = Paragraph(image_title, small_caption_style)
-                    photos_in_row.append([img, img_caption])
+                    img = RLImage(_image_file(image_to_display, image_cache), width=3.2*inch, height=2.4*inch)
+                    img_caption = Paragraph(image_title, _SMALL_CAPTION_STYLE)
+                    photo_cells.append([img, img_caption])
                 except Exception as e:
                     print(f"Warning: Could not add image {image_to_display}: {e}")
-                    photos_in_row.append([
-                        Paragraph("[Image not found]", small_caption_style),
-                        Paragraph(image_title + " (file not found)", small_caption_style)
+                    photo_cells.append([
+                        Paragraph("[Image not found]", _SMALL_CAPTION_STYLE),
+                        Paragraph(image_title + " (file not found)", _SMALL_CAPTION_STYLE)
                     ])
             else:
-                photos_in_row.append([
-                    Paragraph("[Image not found]", small_caption_style),
-                    Paragraph(image_title + " (file not found)", small_caption_style)
+                photo_cells.append([
+                    Paragraph("[Image not found]", _SMALL_CAPTION_STYLE),
+                    Paragraph(image_title + " (file not found)", _SMALL_CAPTION_STYLE)
                 ])
-            
-            if len(photos_in_row) == 2:
-                img_block_table = Table(
-                    [[p[0] for p in photos_in_row], [p[1] for p in photos_in_row]],
-                    colWidths=[3.5*inch, 3.5*inch],
-                    rowHeights=[2.4*inch, None]
-                )
-                img_block_table.setStyle(TableStyle([
-                    ('BOX', (0,0), (-1,-1), 1, colors.black),
-                    ('ALIGN', (0,0), (-1,-1), 'CENTER'),
-                    ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
-                    ('LEFTPADDING', (0,0), (-1,-1), 5),
-                    ('RIGHTPADDING', (0,0), (-1,-1), 5),
-                    ('TOPPADDING', (0,0), (-1,-1), 5),
-                    ('BOTTOMPADDING', (0,0), (-1,-1), 5),
-                ]))
-                elements_for_photos.append(img_block_table)
-                elements_for_photos.append(Spacer(1, 0.2*inch))
-                photos_in_row = []
-        
-        # Add remaining photos if odd number
-        if photos_in_row:
-            if len(photos_in_row) == 1:
-                photos_in_row.append([Spacer(1, 0.1), Spacer(1, 0.1)])
-            img_block_table = Table(
-                [[p[0] for p in photos_in_row], [p[1] for p in photos_in_row]],
-                colWidths=[3.5*inch, 3.5*inch],
-                rowHeights=[2.4*inch, None]
-            )
-            img_block_table.setStyle(TableStyle([
-                ('BOX', (0,0), (-1,-1), 1, colors.black),
+        
+        # One table for the whole grid: per pair of photos an image row and a
+        # caption row (boxed, kept on one page), then a 0.2" gap row
+        if photo_cells:
+            if len(photo_cells) % 2:
+                photo_cells.append([Spacer(1, 0.1), Spacer(1, 0.1)])
+            grid_data, row_heights = [], []
+            grid_style = [
                 ('ALIGN', (0,0), (-1,-1), 'CENTER'),
                 ('VALIGN', (0,0), (-1,-1), 'MIDDLE'),
                 ('LEFTPADDING', (0,0), (-1,-1), 5),
                 ('RIGHTPADDING', (0,0), (-1,-1), 5),
                 ('TOPPADDING', (0,0), (-1,-1), 5),
                 ('BOTTOMPADDING', (0,0), (-1,-1), 5),
-            ]))
-            elements_for_photos.append(img_block_table)
-            elements_for_photos.append(Spacer(1, 0.2*inch))
+            ]
+            for i in range(0, len(photo_cells), 2):
+                left, right = photo_cells[i], photo_cells[i + 1]
+                row = len(grid_data)
+                if row:
+                    grid_data.append(['', ''])
+                    row_heights.append(0.2*inch)
+                    grid_style.append(('TOPPADDING', (0,row), (-1,row), 0))
+                    grid_style.append(('BOTTOMPADDING', (0,row), (-1,row), 0))
+                    row += 1
+                grid_data.append([left[0], right[0]])
+                grid_data.append([left[1], right[1]])
+                row_heights.extend([2.4*inch, None])
+                grid_style.append(('BOX', (0,row), (-1,row + 1), 1, colors.black))
+                grid_style.append(('NOSPLIT', (0,row), (-1,row + 1)))
+            
+            story.append(Table(
+                grid_data,
+                colWidths=[3.5*inch, 3.5*inch],
+                rowHeights=row_heights,
+                style=TableStyle(grid_style)
+            ))
+            story.append(Spacer(1, 0.2*inch))
         
-        story.extend(elements_for_photos)
         story.append(Spacer(1, 0.5*inch))
         
         # Build PDF
@@ -392,7 +420,8 @@ def generate_analysis_pdf(
     report_id: str,
     pdf_path: str,
     analysis_text: str,
-    photo_results: List[Dict]
+    photo_results: List[Dict],
+    image_cache: Optional[Dict[str, Future]] = None
 ) -> str:
     """
     Generate analysis PDF with detailed text and all photos.
@@ -402,6 +431,7 @@ def generate_analysis_pdf(
         pdf_path: Full path where PDF should be saved
         analysis_text: Text analysis output
         photo_results: List of photo results with all annotation paths
+        image_cache: Prepared photos by path, shared with generate_invoice_pdf
         
     Returns:
         Path to generated PDF
@@ -415,24 +445,14 @@ def generate_analysis_pdf(
             topMargin=1*inch,
             bottomMargin=1*inch
         )
-        styles = getSampleStyleSheet()
-        
-        mono_style = ParagraphStyle(
-            name='Mono',
-            fontName='Courier',
-            fontSize=8,
-            leading=9,
-            alignment=TA_LEFT,
-            wordWrap='CJK'
-        )
-        
+        styles = _STYLES
         story = []
         
         def _create_framed_image_block(image_path, title_text, width=3.5*inch, height=2.625*inch):
             elements = []
             if image_path and os.path.exists(image_path):
                 try:
-                    img = RLImage(image_path, width=width, height=height)
+                    img = RLImage(_image_file(image_path, image_cache), width=width, height=height)
                     elements.append(img)
                 except Exception as e:
                     print(f"Warning: Could not add image {image_path}: {e}")
@@ -458,12 +478,11 @@ def generate_analysis_pdf(
         story.append(Paragraph(f"Analysis Report: {report_id}", styles['Title']))
         story.append(Spacer(1, 0.2*inch))
         
-        # Analysis text
+        # Analysis text: one Preformatted flowable (laid out once, split across
+        # pages by ReportLab) instead of a Paragraph + Spacer per line
         if analysis_text:
-            for line in analysis_text.split('\n'):
-                if line.strip():  # Skip empty lines
-                    story.append(Paragraph(line, mono_style))
-                    story.append(Spacer(1, 0.05*inch))
+            lines = [line for line in analysis_text.split('\n') if line.strip()]  # Skip empty lines
+            story.append(Preformatted('\n'.join(lines), _MONO_STYLE, maxLineLength=_MONO_LINE_CHARS, newLineChars=''))
         
         # Photos section
         story.append(Spacer(1, 0.5*inch))
@@ -475,7 +494,7 @@ def generate_analysis_pdf(
             
             # Original image
             if original_path:
-                story.append(_create_framed_image_block(original_path, f"Photo {photo_num}: Original", styles))
+                story.append(_create_framed_image_block(original_path, f"Photo {photo_num}: Original"))
                 story.append(Spacer(1, 0.1*inch))
             
             # Consensus image if available
@@ -483,8 +502,7 @@ def generate_analysis_pdf(
             if consensus_path:
                 story.append(_create_framed_image_block(
                     consensus_path,
-                    f"Photo {photo_num}: Final Consensus Damage",
-                    styles
+                    f"Photo {photo_num}: Final Consensus Damage"
                 ))
                 story.append(Spacer(1, 0.1*inch))
             
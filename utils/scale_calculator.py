@@ -5,6 +5,19 @@ Calculates scale (cm per pixel) based on detected reference objects
 
 import numpy as np
 from typing import Dict, Optional, Tuple
+from app.utils.categories import category_flags, HANDLE, TIRE, HEADLIGHT, LICENSE, WINDSHIELD
+
+def _box_arrays(res) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray]:
+    """xywh, xyxy, conf and integer class ids of a result's boxes as host arrays"""
+    boxes = res.boxes
+    if boxes is None or not len(boxes):
+        return np.empty((0, 4), np.float32), np.empty((0, 4), np.float32), np.empty(0, np.float32), np.empty(0, int)
+    return (
+        boxes.xywh.cpu().numpy().astype(np.float32, copy=False),
+        boxes.xyxy.cpu().numpy().astype(np.float32, copy=False),
+        boxes.conf.cpu().numpy().astype(np.float32, copy=False),
+        boxes.cls.cpu().numpy().astype(int),
+    )
 
 def calculate_scale(
     handle_res,
@@ -22,66 +35,61 @@ def calculate_scale(
     Returns:
         Dict with scale_cm_per_px, source, and detection details
     """
-    best_handle_px = 0
-    best_tire_px = 0
-    best_headlight_px = 0
-    best_license_px = 0
-    tire_boxes = []
-    windshield_boxes = []
     conf_th = 0.5
     
-    # Process handle detection
-    if handle_res.boxes is not None:
-        for box in handle_res.boxes:
-            name = handle_res.names[int(box.cls)].lower()
-            if "handle" in name and box.conf > conf_th:
-                width_px = box.xywh[0][2].item()
-                best_handle_px = max(best_handle_px, width_px)
+    # One pass over both models' detections (one device->host copy per tensor).
+    # Handles only count from the handle model; tire, headlight, license and
+    # windshield only from the component model.
+    h_xywh, h_xyxy, h_conf, h_cls = _box_arrays(handle_res)
+    c_xywh, c_xyxy, c_conf, c_cls = _box_arrays(component_res)
+    xywh = np.concatenate((h_xywh, c_xywh))
+    xyxy = np.concatenate((h_xyxy, c_xyxy))
+    conf = np.concatenate((h_conf, c_conf))
+    flags = np.concatenate((
+        category_flags(handle_res.names, h_cls) & HANDLE,
+        category_flags(component_res.names, c_cls) & ~HANDLE,
+    ))
+    widths = xywh[:, 2]
+    
+    # Handle detection
+    mask = ((flags & HANDLE) != 0) & (conf > conf_th)
+    best_handle_px = widths[mask].max(initial=0)
+    
+    # Tire/Wheel detection
+    mask = ((flags & TIRE) != 0) & (conf > conf_th)
+    best_tire_px = np.minimum(widths[mask], xywh[mask, 3]).max(initial=0)
+    tire_boxes = list(xyxy[mask])
+    
+    # Headlight detection
+    mask = ((flags & HEADLIGHT) != 0) & (conf > 0.3)
+    best_headlight_px = widths[mask].max(initial=0)
+    
+    # License plate detection
+    mask = ((flags & LICENSE) != 0) & (conf > 0.65)
+    best_license_px = widths[mask].max(initial=0)
     
-    # Process component detection (tire, headlight, license, windshield)
-    if component_res.boxes is not None:
-        for box in component_res.boxes:
-            name = component_res.names[int(box.cls)].lower()
-            
-            # Tire/Wheel detection
-            if ("wheel" in name or "tire" in name) and box.conf > conf_th:
-                width_px = min(box.xywh[0][2].item(), box.xywh[0][3].item())
-                best_tire_px = max(best_tire_px, width_px)
-                tire_boxes.append(box.xyxy[0].cpu().numpy())
-            
-            # Headlight detection
-            if "headlight" in name and box.conf > 0.3:
-                width_px = box.xywh[0][2].item()
-                best_headlight_px = max(best_headlight_px, width_px)
-            
-            # License plate detection
-            if ("license" in name or "plate" in name) and box.conf > 0.65:
-                width_px = box.xywh[0][2].item()
-                best_license_px = max(best_license_px, width_px)
-            
-            # Windshield detection (for later use)
-            if "windshield" in name and box.conf > conf_th:
-                windshield_boxes.append(box.xyxy[0].cpu().numpy())
+    # Windshield detection (for later use)
+    mask = ((flags & WINDSHIELD) != 0) & (conf > conf_th)
+    windshield_boxes = list(xyxy[mask])
     
-    # Calculate scales
-    tire_scale = tire_diameter / best_tire_px if best_tire_px > 0 else None
-    handle_scale = handle_width / best_handle_px if best_handle_px > 0 else None
-    license_scale = license_width / best_license_px if best_license_px > 0 else None
-    headlight_scale = 33.0 / best_headlight_px if best_headlight_px > 0 else None  # Fixed 33cm
+    # Plain floats for the JSON metadata
+    best_handle_px = float(best_handle_px)
+    best_tire_px = float(best_tire_px)
+    best_headlight_px = float(best_headlight_px)
+    best_license_px = float(best_license_px)
     
-    # Determine final scale based on priority
-    if tire_scale:
-        scale_cm_per_px = tire_scale
-        source = "TIRE/WHEEL-BASED (Priority 1)"
-    elif handle_scale:
-        scale_cm_per_px = handle_scale
-        source = "HANDLE-BASED (Priority 2)"
-    elif license_scale:
-        scale_cm_per_px = license_scale
-        source = "LICENSE PLATE-BASED (Priority 3)"
-    elif headlight_scale:
-        scale_cm_per_px = headlight_scale
-        source = "HEADLIGHT-BASED (33 cm fixed – Priority 4)"
+    # Determine final scale based on priority: the first reference that was
+    # detected wins and lower-priority divisions are never computed
+    for best_px, reference_cm, source in (
+        (best_tire_px, tire_diameter, "TIRE/WHEEL-BASED (Priority 1)"),
+        (best_handle_px, handle_width, "HANDLE-BASED (Priority 2)"),
+        (best_license_px, license_width, "LICENSE PLATE-BASED (Priority 3)"),
+        (best_headlight_px, 33.0, "HEADLIGHT-BASED (33 cm fixed – Priority 4)"),  # Fixed 33cm
+    ):
+        if best_px > 0:
+            scale_cm_per_px = reference_cm / best_px
+            if scale_cm_per_px:  # A zero reference size falls through, as before
+                break
     else:
         # Fallback: assume image width = 1 meter
         scale_cm_per_px = 100.0 / image_width_px
@@ -0,0 +1,21 @@
+"""
+Supabase Client - one shared client per process
+"""
+
+from functools import lru_cache
+from typing import Optional
+from supabase import create_client, Client
+from app.config import config
+
+
+@lru_cache(maxsize=1)
+def get_supabase() -> Optional[Client]:
+    """
+    Return the process-wide Supabase client, creating it on first use.
+    Reusing it keeps the HTTP connection pool (and its TLS sessions) warm
+    across status polls instead of rebuilding them per request.
+    Returns None when Supabase is not configured.
+    """
+    if not config.SUPABASE_URL or not config.SUPABASE_SERVICE_KEY:
+        return None
+    return create_client(config.SUPABASE_URL, config.SUPABASE_SERVICE_KEY)
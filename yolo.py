@@ -4,51 +4,460 @@ Handles image processing using handle_best.pt model
 """
 
 from fastapi import APIRouter, File, UploadFile, HTTPException
-from fastapi.responses import JSONResponse
+from fastapi.responses import ORJSONResponse
 from ultralytics import YOLO
+from cachetools import TTLCache
 from PIL import Image
+import asyncio
+import fcntl
+import hashlib
 import io
 import os
-from typing import Optional
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlsplit
+from typing import Optional, Tuple, Union
+import numpy as np
+import torch
+import torch.nn.functional as F
+
+# Optional libjpeg-turbo decoder (PyTurboJPEG); PIL handles everything when absent
+try:
+    from turbojpeg import TurboJPEG, TJPF_RGB
+    _tj = TurboJPEG()
+except (ImportError, OSError):
+    _tj = None
 
 router = APIRouter(prefix="/yolo", tags=["yolo"])
 
 # Global variable to store the loaded model
 model: Optional[YOLO] = None
 MODEL_PATH = os.path.join(os.path.dirname(__file__), "..", "models", "handle_best.pt")
+IMG_SIZE = 640
+UPLOAD_CHUNK = 1 << 20
+MAX_BATCH = int(os.getenv("YOLO_MAX_BATCH", "8"))
+
+# CUDA hosts: YOLO_TENSORRT=1 serves a TensorRT FP16 engine exported from the
+# .pt (opt-in, like ENGINE for the assessment models; needs tensorrt installed)
+YOLO_TENSORRT = os.getenv("YOLO_TENSORRT", "0") == "1"
+
+# CPU hosts: YOLO_ONNX_INT8=1 serves a statically INT8-quantized ONNX export
+# through onnxruntime, calibrated on up to 100 images from YOLO_INT8_CALIB_DIR
+YOLO_ONNX_INT8 = os.getenv("YOLO_ONNX_INT8", "0") == "1"
+YOLO_INT8_CALIB_DIR = os.getenv("YOLO_INT8_CALIB_DIR", "")
+
+# Remote inference: TRITON_URL (e.g. grpc://triton:8001/handle_best) sends
+# batches to a Triton Inference Server, whose dynamic batching also coalesces
+# requests across API workers. Ultralytics talks to Triton directly.
+TRITON_URL = os.getenv("TRITON_URL", "")
+_triton_client = None
+
+# Micro-batching: /predict requests arriving within MAX_WAIT_MS of each other
+# share one forward pass
+MAX_WAIT_MS = float(os.getenv("YOLO_MAX_WAIT_MS", "8"))
+
+# Exact-bytes response cache: dashboards and retries re-send the same image.
+# Keyed by a BLAKE2b digest of the upload.
+_response_cache = TTLCache(
+    maxsize=int(os.getenv("YOLO_CACHE_SIZE", "1024")),
+    ttl=float(os.getenv("YOLO_CACHE_TTL", "300")),
+)
+
+# FP16 on CUDA (Tensor Core kernels); TF32 for any remaining FP32 matmuls
+USE_HALF = torch.cuda.is_available()
+DEVICE = "cuda:0" if USE_HALF else "cpu"
+torch.set_float32_matmul_precision("high")
+# Input shapes are fixed by the letterbox, so cuDNN's autotuned conv choice is reused
+torch.backends.cudnn.benchmark = True
+
+# NHWC activations on Tensor Core GPUs (compute capability >= 7.0) spare
+# cuDNN its internal layout transposes
+CHANNELS_LAST = USE_HALF and torch.cuda.get_device_capability()[0] >= 7
+
+# Uploads run on their own CUDA stream from pinned memory, so one image's
+# copy overlaps the previous image's letterbox kernels
+_copy_stream = torch.cuda.Stream() if USE_HALF else None
+_pinned = torch.empty(0, dtype=torch.uint8)  # staging buffer, grown on demand
+
+# torch.compile (Inductor) for the PyTorch backend on CUDA, torch >= 2.1
+YOLO_COMPILE = (
+    USE_HALF
+    and os.getenv("YOLO_COMPILE", "1") == "1"
+    and tuple(int(v) for v in torch.__version__.split(".")[:2]) >= (2, 1)
+)
+
+def _weights_sha256(model_path: str) -> str:
+    """SHA-256 of the weights file, recorded next to artifacts built from it"""
+    sha = hashlib.sha256()
+    with open(model_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            sha.update(chunk)
+    return sha.hexdigest()
+
+def _artifact_is_current(artifact: str, digest: str) -> bool:
+    """True if artifact exists and was built from weights with this digest"""
+    try:
+        with open(artifact + ".sha256") as f:
+            return f.read().strip() == digest and os.path.exists(artifact)
+    except OSError:
+        return False
+
+def _record_artifact(artifact: str, digest: str):
+    """Write the sha256 sidecar for an artifact built from weights with this digest"""
+    with open(artifact + ".sha256", "w") as f:
+        f.write(digest)
+
+def _tensorrt_engine(model_path: str) -> Optional[str]:
+    """Return a TensorRT FP16 engine next to model_path, (re)exporting it when the weights change (None if unavailable)."""
+    if not YOLO_TENSORRT or not torch.cuda.is_available():
+        return None
+    try:
+        import tensorrt  # noqa: F401
+    except ImportError:
+        print("tensorrt not installed, using PyTorch weights")
+        return None
+    
+    engine_path = os.path.splitext(model_path)[0] + ".engine"
+    digest = _weights_sha256(model_path)
+    # Workers may race on first boot: one exports, the others wait and reuse it
+    with open(engine_path + ".lock", "w") as lock:
+        fcntl.flock(lock, fcntl.LOCK_EX)
+        if _artifact_is_current(engine_path, digest):
+            return engine_path
+        try:
+            print(f"Exporting {model_path} to TensorRT (one-time, may take a few minutes)")
+            engine_path = YOLO(model_path).export(
+                format="engine", half=True, imgsz=IMG_SIZE, dynamic=True, batch=MAX_BATCH
+            )
+        except Exception as e:
+            print(f"TensorRT export failed, using PyTorch weights: {e}")
+            return None
+        _record_artifact(engine_path, digest)
+        return engine_path
+
+def _onnx_int8_model(model_path: str) -> Optional[str]:
+    """Return an INT8 ONNX model next to model_path on CPU hosts, quantizing it on first use (None if unavailable)"""
+    if torch.cuda.is_available() or not YOLO_ONNX_INT8:
+        return None
+    int8_path = os.path.splitext(model_path)[0] + "_int8.onnx"
+    digest = _weights_sha256(model_path)
+    if _artifact_is_current(int8_path, digest):
+        return int8_path
+    try:
+        from onnxruntime.quantization import CalibrationDataReader, QuantFormat, QuantType, quantize_static
+    except ImportError:
+        print("onnxruntime not installed, using PyTorch weights")
+        return None
+    
+    calib_paths = sorted(
+        os.path.join(YOLO_INT8_CALIB_DIR, name) for name in os.listdir(YOLO_INT8_CALIB_DIR)
+    )[:100] if os.path.isdir(YOLO_INT8_CALIB_DIR) else []
+    if not calib_paths:
+        print("INT8 quantization needs calibration images in YOLO_INT8_CALIB_DIR, using PyTorch weights")
+        return None
+    
+    class _Calibration(CalibrationDataReader):
+        """Feeds calibration images through the same decode and letterbox as /predict"""
+        
+        def __init__(self):
+            self._paths = iter(calib_paths)
+        
+        def get_next(self):
+            path = next(self._paths, None)
+            if path is None:
+                return None
+            with open(path, "rb") as f:
+                image = _decode_image(f.read())[0]
+            return {"images": _letterbox_batch([image])[0].numpy()}
+    
+    try:
+        print(f"Quantizing {model_path} to INT8 ONNX (one-time)")
+        onnx_path = YOLO(model_path).export(format="onnx", opset=17, simplify=True, imgsz=IMG_SIZE, dynamic=True)
+        quantize_static(
+            onnx_path, int8_path, _Calibration(),
+            quant_format=QuantFormat.QDQ,
+            activation_type=QuantType.QUInt8,
+            weight_type=QuantType.QInt8,
+            per_channel=True,
+        )
+        _record_artifact(int8_path, digest)
+        return int8_path
+    except Exception as e:
+        print(f"INT8 quantization failed, using PyTorch weights: {e}")
+        return None
+
+# Where handle_best.pt may live, depending on the working directory
+_MODEL_CANDIDATES = (
+    MODEL_PATH,
+    "handle_best.pt",
+    os.path.join("models", "handle_best.pt"),
+    os.path.join(os.path.dirname(__file__), "..", "handle_best.pt"),
+)
+
+def _resolve_model_path() -> Optional[str]:
+    """First existing model file candidate, or None"""
+    return next((path for path in _MODEL_CANDIDATES if os.path.exists(path)), None)
+
+# Resolved once at import; only re-searched while the file is still missing
+_resolved_model_path = _resolve_model_path()
 
 def load_model() -> YOLO:
     """Load the YOLO model once at startup"""
-    global model
+    global model, _resolved_model_path
+    if model is None and TRITON_URL:
+        model = YOLO(TRITON_URL, task="detect")
+        print(f"Using Triton model at {TRITON_URL}")
     if model is None:
-        # Try multiple possible paths
-        possible_paths = [
-            MODEL_PATH,
-            "handle_best.pt",
-            os.path.join("models", "handle_best.pt"),
-            os.path.join(os.path.dirname(__file__), "..", "handle_best.pt"),
-        ]
-        
-        model_path = None
-        for path in possible_paths:
-            if os.path.exists(path):
-                model_path = path
-                break
-        
-        if model_path is None:
+        if _resolved_model_path is None:
+            _resolved_model_path = _resolve_model_path()
+        if _resolved_model_path is None:
             raise FileNotFoundError(
-                f"Model file handle_best.pt not found. Tried: {possible_paths}. "
+                f"Model file handle_best.pt not found. Tried: {list(_MODEL_CANDIDATES)}. "
                 "Please upload it to the server."
             )
         
-        model = YOLO(model_path)
+        # Prefer a fused TensorRT engine on CUDA or an INT8 ONNX model on CPU;
+        # fall back to the .pt checkpoint
+        model_path = (
+            _tensorrt_engine(_resolved_model_path)
+            or _onnx_int8_model(_resolved_model_path)
+            or _resolved_model_path
+        )
+        model = YOLO(model_path, task="detect")
         print(f"Model {model_path} loaded successfully")
     return model
 
+class _PendingPrediction:
+    """One /predict image waiting for the batching worker."""
+    
+    __slots__ = ("image", "future")
+    
+    def __init__(self, image, future: asyncio.Future):
+        self.image = image
+        self.future = future
+
+_batch_queue: "asyncio.Queue[_PendingPrediction]" = asyncio.Queue()
+_batch_task: Optional[asyncio.Task] = None
+
+def _pinned_staging(nbytes: int) -> torch.Tensor:
+    """Pinned host buffer of at least nbytes, reused across batches (only the batching worker calls this)"""
+    global _pinned
+    if _pinned.numel() < nbytes:
+        _pinned = torch.empty(nbytes, dtype=torch.uint8).pin_memory()
+    return _pinned
+
+def _letterbox_batch(images: list) -> Tuple[torch.Tensor, list]:
+    """
+    Upload decoded RGB arrays and letterbox them on DEVICE
+    
+    Returns:
+        (normalized RGB BCHW batch of IMG_SIZE squares, per-image (gain, pad_x, pad_y, width, height))
+    """
+    dtype = torch.float16 if USE_HALF else torch.float32
+    batch = torch.full((len(images), 3, IMG_SIZE, IMG_SIZE), 114, dtype=dtype, device=DEVICE)  # Ultralytics' letterbox grey
+    if CHANNELS_LAST:
+        batch = batch.contiguous(memory_format=torch.channels_last)
+    letterboxes = []
+    # The previous batch's copies have finished: _infer synced on its results
+    staging = _pinned_staging(sum(arr.nbytes for arr in images)) if _copy_stream is not None else None
+    offset = 0
+    for i, arr in enumerate(images):
+        # Raw HWC uint8 goes up once; resize and scaling happen on the device
+        if staging is None:
+            t = torch.from_numpy(arr).to(DEVICE)
+        else:
+            host = staging[offset:offset + arr.nbytes].view(arr.shape)
+            offset += arr.nbytes
+            host.copy_(torch.from_numpy(arr))
+            with torch.cuda.stream(_copy_stream):
+                t = host.to(DEVICE, non_blocking=True)
+            torch.cuda.current_stream().wait_stream(_copy_stream)
+            t.record_stream(torch.cuda.current_stream())
+        t = t.permute(2, 0, 1)
+        h, w = arr.shape[:2]
+        gain = min(IMG_SIZE / h, IMG_SIZE / w)
+        nw, nh = round(w * gain), round(h * gain)
+        pad_x, pad_y = (IMG_SIZE - nw) // 2, (IMG_SIZE - nh) // 2
+        t = t.unsqueeze(0).to(dtype)
+        if (nh, nw) != (h, w):
+            t = F.interpolate(t, size=(nh, nw), mode="bilinear", align_corners=False)
+        batch[i, :, pad_y:pad_y + nh, pad_x:pad_x + nw] = t[0]
+        letterboxes.append((gain, pad_x, pad_y, w, h))
+    return batch.div_(255), letterboxes
+
+def _unletterbox(data: np.ndarray, letterbox: tuple) -> np.ndarray:
+    """Map box rows (x1, y1, x2, y2, ..., conf, cls) from the IMG_SIZE square back to decoded-image pixels"""
+    gain, pad_x, pad_y, w, h = letterbox
+    xyxy = data[:, :4]
+    xyxy -= np.array([pad_x, pad_y, pad_x, pad_y], dtype=data.dtype)
+    xyxy /= gain
+    np.clip(xyxy, 0, [w, h, w, h], out=xyxy)
+    return data
+
+# All inference, warm-up included, runs on this one thread: Inductor keeps
+# CUDA graphs per thread, so graphs recorded at warm-up are only replayed by
+# batches run on the same thread
+_inference_executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="yolo-infer")
+
+def _infer(images: list) -> list:
+    """Run one blocking YOLO forward pass; return each image's box rows in its own decoded pixels"""
+    with torch.inference_mode():
+        batch, letterboxes = _letterbox_batch(images)
+        results = (model or load_model())(batch, half=USE_HALF, device=DEVICE, imgsz=IMG_SIZE)
+        # One device->host copy for the whole batch
+        datas = [result.boxes.data for result in results]
+        host = torch.cat(datas).float().cpu().numpy()
+    splits = np.cumsum([len(d) for d in datas[:-1]])
+    return [_unletterbox(data, letterbox) for data, letterbox in zip(np.split(host, splits), letterboxes)]
+
+async def _batch_worker():
+    """Drain the queue into batches of up to MAX_BATCH and run them through YOLO."""
+    loop = asyncio.get_running_loop()
+    while True:
+        batch = [await _batch_queue.get()]
+        deadline = loop.time() + MAX_WAIT_MS / 1000
+        while len(batch) < MAX_BATCH:
+            remaining = deadline - loop.time()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(await asyncio.wait_for(_batch_queue.get(), remaining))
+            except asyncio.TimeoutError:
+                break
+        
+        try:
+            # Off the event loop, so requests keep being accepted and decoded meanwhile
+            results = await loop.run_in_executor(_inference_executor, _infer, [item.image for item in batch])
+        except Exception as e:
+            for item in batch:
+                if not item.future.done():  # client may have gone away
+                    item.future.set_exception(e)
+            continue
+        for item, result in zip(batch, results):
+            if not item.future.done():
+                item.future.set_result(result)
+
+def _decode_image(image_data: Union[bytes, memoryview]) -> Tuple[np.ndarray, Tuple[int, int]]:
+    """
+    Decode an upload for YOLO, shrinking large JPEGs during decode
+    
+    Returns:
+        (contiguous HWC uint8 RGB array, original (width, height))
+    """
+    if _tj is not None and image_data[:3] == b"\xff\xd8\xff":
+        try:
+            orig_width, orig_height = _tj.decode_header(image_data)[:2]
+            # Largest DCT scale that keeps both sides >= IMG_SIZE
+            factor = next(
+                (f for f in ((1, 8), (1, 4), (1, 2))
+                 if -(-min(orig_width, orig_height) * f[0] // f[1]) >= IMG_SIZE),
+                None,
+            )
+            return _tj.decode(image_data, pixel_format=TJPF_RGB, scaling_factor=factor), (orig_width, orig_height)
+        except OSError:
+            pass  # e.g. CMYK JPEGs; let PIL handle them
+    
+    image = Image.open(io.BytesIO(image_data))
+    orig_size = image.size
+    
+    # Let libjpeg decode straight to RGB at a reduced DCT scale (never below
+    # the YOLO input size); no-op for non-JPEG images
+    image.draft('RGB', (IMG_SIZE, IMG_SIZE))
+    
+    if image.mode == 'RGBA':
+        # Composite onto white in one vectorized pass
+        rgba = np.asarray(image)
+        alpha = rgba[..., 3:4] * np.float32(1 / 255)
+        return (rgba[..., :3] * alpha + 255 * (1 - alpha) + 0.5).astype(np.uint8), orig_size
+    # np.array, not asarray: torch.from_numpy needs a writable buffer
+    return np.array(image if image.mode == 'RGB' else image.convert('RGB')), orig_size
+
+async def _read_upload(file: UploadFile) -> memoryview:
+    """Read an upload in chunks into one buffer sized up front"""
+    size = getattr(file, "size", None)  # Starlette >= 0.24
+    if size is None:
+        return memoryview(await file.read())
+    buf = memoryview(bytearray(size))
+    offset = 0
+    while chunk := await file.read(UPLOAD_CHUNK):
+        buf[offset:offset + len(chunk)] = chunk
+        offset += len(chunk)
+    return buf[:offset]
+
+def _optimize_model(yolo: YOLO, dummy: np.ndarray):
+    """Switch the predictor's network to channels_last and compile it with Inductor (eager if that fails)"""
+    if not isinstance(yolo.model, torch.nn.Module):  # exported backends
+        return
+    # Work on the predictor's network, not yolo.model: the predictor re-fuses
+    # yolo.model on setup, which would unwrap a compiled module.
+    eager = yolo.predictor.model.model
+    if CHANNELS_LAST:
+        eager = eager.to(memory_format=torch.channels_last)
+    if not YOLO_COMPILE:
+        return
+    try:
+        yolo.predictor.model.model = torch.compile(eager, mode="reduce-overhead", fullgraph=False)
+        _infer([dummy])  # compilation is lazy; surface failures here
+        print("torch.compile enabled")
+    except Exception as e:
+        yolo.predictor.model.model = eager
+        print(f"torch.compile unavailable, using eager mode: {e}")
+
+@router.on_event("startup")
+async def warm_up_model():
+    """Load the model and run a dummy batch of every size so the first requests aren't penalized"""
+    try:
+        await asyncio.get_running_loop().run_in_executor(_inference_executor, _warm_up)
+    except FileNotFoundError as e:
+        print(f"Skipping YOLO warm-up: {e}")
+        return
+    print("YOLO model warmed up")
+
+def _warm_up():
+    """Load, optimize and warm the model (on the inference thread)"""
+    load_model()
+    dummy = np.zeros((IMG_SIZE, IMG_SIZE, 3), dtype=np.uint8)
+    _infer([dummy])  # builds the predictor
+    _optimize_model(model, dummy)
+    # Compiles, autotunes and records a CUDA graph for every batch size the
+    # batching worker can send
+    for batch_size in range(1, MAX_BATCH + 1):
+        _infer([dummy] * batch_size)
+
+@router.on_event("startup")
+async def start_batch_worker():
+    """Start the batching worker on the server's event loop"""
+    global _batch_task
+    _batch_task = asyncio.create_task(_batch_worker())
+
+@router.on_event("shutdown")
+async def stop_batch_worker():
+    """Stop the batching worker"""
+    if _batch_task is not None:
+        _batch_task.cancel()
+
+def _triton_model_ready() -> bool:
+    """Ask the Triton server whether the TRITON_URL model is loaded"""
+    global _triton_client
+    url = urlsplit(TRITON_URL)
+    if _triton_client is None:
+        if url.scheme == "grpc":
+            import tritonclient.grpc as triton
+        else:
+            import tritonclient.http as triton
+        _triton_client = triton.InferenceServerClient(url.netloc)
+    return _triton_client.is_model_ready(url.path.strip("/"))
+
 @router.get("/health")
 async def yolo_health():
     """Health check endpoint for YOLO service"""
     try:
+        if TRITON_URL:
+            ready = await asyncio.to_thread(_triton_model_ready)
+            return {
+                "status": "healthy" if ready else "unhealthy",
+                "model_loaded": ready,
+                "model_path": TRITON_URL
+            }
         yolo_model = load_model()
         return {
             "status": "healthy",
@@ -79,44 +488,43 @@ async def predict(file: UploadFile = File(...)):
             raise HTTPException(status_code=400, detail="File must be an image")
         
         # Read image data into memory (without saving to disk)
-        image_data = await file.read()
+        image_data = await _read_upload(file)
         
-        # Convert to PIL Image for processing
-        image = Image.open(io.BytesIO(image_data))
+        cache_key = hashlib.blake2b(image_data, digest_size=16).digest()
+        cached = _response_cache.get(cache_key)
+        if cached is not None:
+            return ORJSONResponse(content=cached)
         
-        # Convert RGBA to RGB if necessary (YOLO expects RGB)
-        if image.mode == 'RGBA':
-            # Create a white background
-            rgb_image = Image.new('RGB', image.size, (255, 255, 255))
-            rgb_image.paste(image, mask=image.split()[3])  # Use alpha channel as mask
-            image = rgb_image
-        elif image.mode != 'RGB':
-            image = image.convert('RGB')
+        image, (orig_width, orig_height) = await asyncio.to_thread(_decode_image, image_data)
+        height, width = image.shape[:2]
         
-        # Load model if not already loaded
-        yolo_model = load_model()
+        # Loaded by the startup warm-up; only a missing file at boot gets here with None
+        yolo_model = model or load_model()
+        
+        # Run inference (batched with any concurrent requests)
+        future = asyncio.get_running_loop().create_future()
+        await _batch_queue.put(_PendingPrediction(image, future))
+        # Box rows (x1, y1, x2, y2, ..., conf, cls)
+        data = await future
         
-        # Run inference
-        results = yolo_model(image)
+        # Boxes are in decoded-image pixels; map back to the original size
+        scale = np.array([orig_width / width, orig_height / height] * 2)
+        # 4 decimals is far below a pixel and keeps the payload short
+        xyxy = np.round(data[:, :4] * scale, 4).tolist()
+        conf = data[:, -2].tolist()
+        cls = data[:, -1].astype(int).tolist()
         
         # Process results
-        detections = []
-        for result in results:
-            boxes = result.boxes
-            for i in range(len(boxes)):
-                box = boxes[i]
-                detection = {
-                    "class": int(box.cls[0]),
-                    "class_name": yolo_model.names[int(box.cls[0])],
-                    "confidence": float(box.conf[0]),
-                    "bbox": {
-                        "x1": float(box.xyxy[0][0]),
-                        "y1": float(box.xyxy[0][1]),
-                        "x2": float(box.xyxy[0][2]),
-                        "y2": float(box.xyxy[0][3]),
-                    }
-                }
-                detections.append(detection)
+        names = yolo_model.names
+        detections = [
+            {
+                "class": c,
+                "class_name": names[c],
+                "confidence": cf,
+                "bbox": {"x1": x1, "y1": y1, "x2": x2, "y2": y2},
+            }
+            for (x1, y1, x2, y2), cf, c in zip(xyxy, conf, cls)
+        ]
         
         # Prepare response
         response = {
@@ -124,12 +532,13 @@ async def predict(file: UploadFile = File(...)):
             "detections": detections,
             "detection_count": len(detections),
             "image_size": {
-                "width": image.width,
-                "height": image.height
+                "width": orig_width,
+                "height": orig_height
             }
         }
         
-        return JSONResponse(content=response)
+        _response_cache[cache_key] = response
+        return ORJSONResponse(content=response)
         
     except FileNotFoundError as e:
         raise HTTPException(status_code=500, detail=f"Model file not found: {str(e)}")